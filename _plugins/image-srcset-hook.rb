@@ -0,0 +1,39 @@
+#!/usr/bin/env ruby
+#
+# Add responsive variants from _data/image_variants.yml (written by
+# tools/image_variants.py) to each post's preview image, and wrap it in a
+# <picture> offering the smaller formats listed under `image.sources`
+
+SRCSET_SIZES = '(max-width: 768px) 100vw, 800px'
+
+Jekyll::Hooks.register :posts, :post_render do |post|
+
+  image = post.data['image']
+  path = image.is_a?(Hash) ? image['path'] : image
+  next unless path.is_a?(String) && !path.include?('://')
+
+  entry = (post.site.data['image_variants'] || {})[path]
+  sources = image.is_a?(Hash) ? Array(image['sources']) : []
+  sources = sources.select { |source| source.is_a?(Hash) && source['path'].is_a?(String) && source['type'] }
+  next unless (entry && entry['srcset']) || sources.any?
+
+  # Resolve paths the way Chirpy does before they reach the <img> tag
+  baseurl = post.site.config['baseurl'].to_s.chomp('/')
+  resolve = lambda do |value|
+    value.start_with?('/') ? "#{baseurl}#{value}" : "#{baseurl}#{File.join('/', post.data['media_subpath'].to_s, value)}"
+  end
+
+  # The first <img> whose src (or lazy-loaded data-src) is the preview image
+  pattern = /<img\b(?=[^>]*\s(?:data-)?src="#{Regexp.escape(resolve.call(path))}")[^>]*>/
+  post.output = post.output.sub(pattern) do |tag|
+    if entry && entry['srcset'] && tag !~ /\ssrcset=/
+      srcset = entry['srcset'].split(', ').map { |item| "#{baseurl}#{item}" }.join(', ')
+      tag = tag.sub(/\A<img\b/) { %(<img srcset="#{srcset}" sizes="#{SRCSET_SIZES}") }
+    end
+    next tag if sources.empty?
+
+    elements = sources.map { |source| %(<source srcset="#{resolve.call(source['path'])}" type="#{source['type']}">) }
+    "<picture>#{elements.join}#{tag}</picture>"
+  end
+
+end
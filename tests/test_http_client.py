@@ -0,0 +1,168 @@
+"""Offline checks of tools/http_client.py against a local stdlib HTTP server."""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tools"))
+
+from http_client import Prefetcher, fetch, fetch_bytes  # noqa: E402
+from stage_runner import StageRunner  # noqa: E402
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.files: Dict[str, bytes] = {}
+        self.requests: List[str] = []
+        # Cleared to hold every response until the test releases it
+        self.gate = threading.Event()
+        self.gate.set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the pooled session keeps connections alive; without
+    # TCP_NODELAY delayed ACKs would add ~40ms to every reused connection
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: FixtureServer
+
+    def do_GET(self) -> None:  # noqa: N802
+        path, _, query = self.path.lstrip("/").partition("?")
+        self.server.requests.append(path)
+        self.server.gate.wait(10)
+        body = self.server.files.get(path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        if query == "nolength":
+            # No Content-Length: the body runs until the connection closes
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[FixtureServer]:
+    fixture = FixtureServer()
+    thread = threading.Thread(target=fixture.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield fixture
+    fixture.gate.set()
+    fixture.shutdown()
+    fixture.server_close()
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the server"
+        time.sleep(0.01)
+
+
+def test_fetch_returns_body_and_status(server: FixtureServer) -> None:
+    server.files["a.bin"] = b"x" * 1000
+    status, body, headers = fetch(server.base_url + "a.bin")
+    assert status == 200
+    assert body == b"x" * 1000
+    assert headers["Content-Length"] == "1000"
+
+
+def test_fetch_refuses_declared_oversize_body(server: FixtureServer) -> None:
+    server.files["big.bin"] = b"x" * 2048
+    with pytest.raises(ValueError, match="limit is 1024"):
+        fetch_bytes(server.base_url + "big.bin", max_bytes=1024)
+
+
+def test_fetch_refuses_streamed_oversize_body(server: FixtureServer) -> None:
+    server.files["big.bin"] = b"x" * 200_000
+    with pytest.raises(ValueError, match="exceeded 100000 bytes"):
+        fetch_bytes(server.base_url + "big.bin?nolength", max_bytes=100_000)
+
+
+def test_fetch_raises_for_http_errors(server: FixtureServer) -> None:
+    with pytest.raises(Exception, match="404"):
+        fetch_bytes(server.base_url + "missing.bin")
+
+
+def test_prefetch_starts_in_submission_order_within_window(server: FixtureServer) -> None:
+    names = [f"{index}.bin" for index in range(6)]
+    for index, name in enumerate(names):
+        server.files[name] = bytes([index]) * 100
+    server.gate.clear()
+    with Prefetcher(max_workers=2) as prefetcher:
+        prefetcher.submit(server.base_url + name for name in names)
+        wait_for(lambda: len(server.requests) == 2)
+        time.sleep(0.1)
+        # The other four wait for a slot instead of all starting at once
+        assert sorted(server.requests) == names[:2]
+        assert all(prefetcher.submitted(server.base_url + name) for name in names)
+
+        server.gate.set()
+        for index, name in enumerate(names):
+            assert prefetcher.result(server.base_url + name) == bytes([index]) * 100
+    # Two workers race within a pair, but a later pair never starts early
+    assert [set(server.requests[index : index + 2]) for index in (0, 2, 4)] == [
+        set(names[index : index + 2]) for index in (0, 2, 4)
+    ]
+
+
+def test_prefetch_releases_bodies_once_read(server: FixtureServer) -> None:
+    server.files["a.bin"] = b"a" * 100
+    server.files["b.bin"] = b"b" * 100
+    url_a, url_b = server.base_url + "a.bin", server.base_url + "b.bin"
+    with Prefetcher(max_workers=1) as prefetcher:
+        prefetcher.submit([url_a, url_b])
+        wait_for(lambda: url_a in prefetcher.succeeded())
+        # An unread body holds the only slot, so b waits
+        assert server.requests == ["a.bin"]
+
+        assert prefetcher.result(url_a) == b"a" * 100
+        assert not prefetcher.submitted(url_a)
+        wait_for(lambda: url_b in prefetcher.succeeded())
+        assert prefetcher.succeeded() == [url_b]
+
+
+def test_prefetch_result_jumps_the_queue(server: FixtureServer) -> None:
+    for name in ("a.bin", "b.bin", "c.bin"):
+        server.files[name] = name.encode()
+    with Prefetcher(max_workers=1) as prefetcher:
+        prefetcher.submit([server.base_url + "a.bin", server.base_url + "b.bin"])
+        assert prefetcher.result(server.base_url + "b.bin") == b"b.bin"
+        assert prefetcher.result(server.base_url + "c.bin") == b"c.bin"
+        assert prefetcher.result(server.base_url + "a.bin") == b"a.bin"
+
+
+def test_prefetch_stops_at_the_stage_deadline(server: FixtureServer) -> None:
+    server.files["slow.bin"] = b"x" * 100
+    server.gate.clear()
+
+    def stage() -> None:
+        with Prefetcher(max_workers=1) as prefetcher:
+            prefetcher.submit([server.base_url + "slow.bin"])
+            prefetcher.result(server.base_url + "slow.bin")
+
+    started = time.monotonic()
+    # The worker thread times out with the stage instead of after 20s
+    with pytest.raises(Exception, match="(?i)timed out"):
+        StageRunner(0.3).run("image", stage)
+    assert time.monotonic() - started < 2
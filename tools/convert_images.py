@@ -1,76 +1,113 @@
 #!/usr/bin/env python3
 """
-Standalone image converter: Convert images to WebP format optimized to 45-50KB.
-Supports both local file paths and URLs.
+Standalone image converter: Convert images to WebP (or AVIF) optimized to 45-50KB.
+Supports local file paths, directories, glob patterns and URLs, optionally
+converted in parallel across worker processes.
 """
 from __future__ import annotations
 
 import argparse
+import contextlib
+import glob
 import io
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
-import requests
 from PIL import Image
 
-DEFAULT_TARGET_KB = 50
-MAX_DIMENSIONS = (1280, 720)
+from http_client import Prefetcher, fetch_bytes
+from image_codec import (
+    FORMATS,
+    PROFILES,
+    available_formats,
+    check_source_size,
+    decode_for_profile,
+    encode_with_profile,
+    rank_with_profile,
+    webp_within_budget,
+)
+from image_variants import VARIANT_NAME
 
+INLINE = PROFILES["inline"]
+# The inline budget is the default target plus its 5KB tolerance
+DEFAULT_TARGET_KB = INLINE.max_kb - 5
+MAX_DIMENSIONS = INLINE.max_dimensions
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+# Skipped when walking a directory: site chrome, and post headers, which
+# media_pipeline.py encodes with the header profile and posts reference as is
+SKIPPED_DIRS = {"favicons", "headers"}
 
-def fetch_image_from_url(url: str, timeout: int = 20) -> bytes:
+
+def fetch_image_from_url(url: str, timeout: float | None = None) -> bytes:
     """Download image from URL."""
     try:
-        resp = requests.get(url, timeout=timeout)
-        resp.raise_for_status()
-        return resp.content
+        return fetch_bytes(url, timeout=timeout)
     except Exception as exc:
         raise RuntimeError(f"Failed to download image from {url}: {exc}")
 
 
-def compress_to_webp(image: Image.Image, target_kb: int = DEFAULT_TARGET_KB) -> bytes:
-    """Compress image to WebP format with target file size."""
-    # Resize to max dimensions while preserving aspect ratio
-    img = image.copy().convert("RGB")
-    img.thumbnail(MAX_DIMENSIONS, Image.Resampling.LANCZOS)
-    
-    best_bytes = None
-    for quality in (85, 80, 75, 70, 65, 60, 55, 50, 45, 40, 35, 30):
-        buffer = io.BytesIO()
-        img.save(buffer, format="WEBP", quality=quality, method=6)
-        data = buffer.getvalue()
-        best_bytes = data
-        size_kb = len(data) / 1024
-        
-        # Accept if within target range (target_kb - 5 to target_kb + 5)
-        if size_kb <= target_kb + 5:
-            print(f"  Optimized to {size_kb:.1f}KB (quality={quality})")
-            break
-    
-    if best_bytes is None:
+def compress_to_format(
+    image: Image.Image, target_kb: int = DEFAULT_TARGET_KB, fmt: str = "webp"
+) -> Tuple[str, bytes]:
+    """Compress image to fmt ("webp", "avif" or "best") with target file size.
+
+    "best" encodes every available format and keeps the one with the highest
+    measured quality within the size range. Returns (format, data).
+    """
+    # Accept if within target range (target_kb - 5 to target_kb + 5)
+    profile = INLINE.with_budget(target_kb + 5)
+    max_bytes = profile.max_bytes
+    if fmt == "best":
+        ranked = rank_with_profile(image, profile, formats=available_formats())
+        for item in ranked:
+            print(f"  {item.fmt.upper()}: {len(item.data) / 1024:.1f}KB quality={item.quality} PSNR={item.psnr:.2f}dB")
+        fmt, data, quality = ranked[0].fmt, ranked[0].data, ranked[0].quality
+    else:
+        data, quality = encode_with_profile(image, profile, fmt)
+    if not data:
         raise RuntimeError("Failed to compress image")
     
-    return best_bytes
+    size_kb = len(data) / 1024
+    if len(data) <= max_bytes:
+        print(f"  Optimized to {size_kb:.1f}KB {fmt.upper()} (quality={quality})")
+    
+    return fmt, data
+
+
+def compress_to_webp(image: Image.Image, target_kb: int = DEFAULT_TARGET_KB) -> bytes:
+    """Compress image to WebP format with target file size."""
+    return compress_to_format(image, target_kb, "webp")[1]
 
 
-def convert_image(source: str, output_dir: Path | None = None, target_kb: int = DEFAULT_TARGET_KB) -> Path:
+def convert_image(
+    source: str,
+    output_dir: Path | None = None,
+    target_kb: int = DEFAULT_TARGET_KB,
+    image_data: bytes | None = None,
+    fmt: str = "webp",
+) -> Path:
     """
-    Convert a single image to WebP format.
+    Convert a single image to WebP (or AVIF) format.
     
     Args:
         source: Local file path or URL
         output_dir: Output directory (defaults to same as source for files, cwd for URLs)
         target_kb: Target file size in KB
+        image_data: Already-downloaded bytes for a URL source (skips the fetch)
+        fmt: Output format: "webp", "avif" or "best" (smallest encode at the highest quality)
     
     Returns:
-        Path to the converted WebP file
+        Path to the converted file
     """
     is_url = source.startswith(("http://", "https://"))
     
     if is_url:
-        print(f"Downloading: {source}")
-        image_data = fetch_image_from_url(source)
-        image = Image.open(io.BytesIO(image_data))
+        if image_data is None:
+            print(f"Downloading: {source}")
+            image_data = fetch_image_from_url(source)
         
         # Generate filename from URL
         url_path = source.split("?")[0]  # Remove query params
@@ -87,7 +124,8 @@ def convert_image(source: str, output_dir: Path | None = None, target_kb: int =
             raise FileNotFoundError(f"Image not found: {source}")
         
         print(f"Converting: {source_path}")
-        image = Image.open(source_path)
+        check_source_size(source_path.stat().st_size)
+        image_data = source_path.read_bytes()
         
         # Determine output path
         if output_dir:
@@ -96,12 +134,20 @@ def convert_image(source: str, output_dir: Path | None = None, target_kb: int =
         else:
             output_path = source_path.with_suffix(".webp")
     
-    # Convert to WebP
-    webp_data = compress_to_webp(image, target_kb)
+    # Convert, unless WebP output was asked for and the source already fits the budget
+    if fmt == "webp" and webp_within_budget(image_data, (target_kb + 5) * 1024, MAX_DIMENSIONS):
+        print("  Already WebP within budget; skipping encode")
+        webp_data = image_data
+    else:
+        image = decode_for_profile(image_data, INLINE, report=True)
+        fmt, webp_data = compress_to_format(image, target_kb, fmt)
+        output_path = output_path.with_suffix(FORMATS[fmt].extension)
     
     # Save to file
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_path.write_bytes(webp_data)
+    # Skip rewriting an untouched source in place
+    if is_url or output_path != source_path or webp_data is not image_data:
+        output_path.write_bytes(webp_data)
     
     size_kb = len(webp_data) / 1024
     print(f"  Saved: {output_path} ({size_kb:.1f}KB)")
@@ -109,20 +155,65 @@ def convert_image(source: str, output_dir: Path | None = None, target_kb: int =
     return output_path
 
 
+def expand_sources(sources: List[str]) -> List[str]:
+    """Expand directories (recursively) and glob patterns into image paths; URLs pass through.
+
+    SKIPPED_DIRS and srcset variants found in a directory are left out;
+    image_variants.py regenerates variants from their source.
+    """
+    expanded: List[str] = []
+    for source in sources:
+        if source.startswith(("http://", "https://")):
+            expanded.append(source)
+        elif Path(source).is_dir():
+            expanded.extend(
+                str(path)
+                for path in sorted(Path(source).rglob("*"))
+                if path.is_file()
+                and path.suffix.lower() in IMAGE_SUFFIXES
+                and not VARIANT_NAME.search(path.stem)
+                and not SKIPPED_DIRS.intersection(path.relative_to(source).parts)
+            )
+        elif glob.has_magic(source):
+            matches = sorted(glob.glob(source, recursive=True))
+            expanded.extend(
+                match for match in matches if Path(match).suffix.lower() in IMAGE_SUFFIXES
+            )
+        else:
+            expanded.append(source)
+    return expanded
+
+
+def convert_image_captured(
+    source: str, output_dir: Path | None, target_kb: int, fmt: str = "webp"
+) -> Tuple[str, Path | None, str, str | None]:
+    """Run convert_image in a worker, capturing its log so the parent can print it in order."""
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            output_path = convert_image(source, output_dir, target_kb, fmt=fmt)
+        except Exception as exc:
+            return source, None, log.getvalue(), str(exc)
+    return source, output_path, log.getvalue(), None
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
-        description="Convert images to WebP format optimized to 45-50KB",
+        description="Convert images to WebP (or AVIF) optimized to 45-50KB",
         epilog="Examples:\n"
                "  %(prog)s image1.jpg image2.png\n"
                "  %(prog)s https://example.com/image.jpg\n"
                "  %(prog)s --output assets/img/ image1.jpg image2.png\n"
-               "  %(prog)s --target-kb 60 large-image.jpg",
+               "  %(prog)s --target-kb 60 large-image.jpg\n"
+               "  %(prog)s --format best photo.png\n"
+               "  %(prog)s --jobs 0 assets/img\n"
+               "  %(prog)s --jobs 4 'assets/img/**/*.png'",
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
     parser.add_argument(
         "images",
         nargs="+",
-        help="Image file paths or URLs to convert",
+        help="Image file paths, directories, glob patterns or URLs to convert",
     )
     parser.add_argument(
         "-o", "--output",
@@ -135,28 +226,78 @@ def main() -> None:
         default=DEFAULT_TARGET_KB,
         help=f"Target file size in KB (default: {DEFAULT_TARGET_KB})",
     )
+    parser.add_argument(
+        "-f", "--format",
+        choices=["webp", "avif", "best"],
+        default="webp",
+        help="Output format; 'best' keeps whichever available format encodes best (default: webp)",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes (default: 1, 0 = one per CPU)",
+    )
     
     args = parser.parse_args()
+    if args.format != "best" and args.format not in available_formats():
+        raise RuntimeError(f"{args.format.upper()} encoding is not supported by this Pillow build")
     
     # Validate output directory
     if args.output:
         args.output.mkdir(parents=True, exist_ok=True)
     
+    sources = expand_sources(args.images)
+    if not sources:
+        raise RuntimeError("No images matched the given paths")
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    
     # Convert all images
     converted: List[Path] = []
     failed: List[str] = []
     
-    for source in args.images:
-        try:
-            output_path = convert_image(source, args.output, args.target_kb)
-            converted.append(output_path)
-        except Exception as exc:
-            print(f"ERROR: {exc}", file=sys.stderr)
-            failed.append(source)
+    if jobs == 1 or len(sources) == 1:
+        urls = [source for source in sources if source.startswith(("http://", "https://"))]
+        # Downloads run on a thread pool so later URLs arrive while earlier ones encode
+        with Prefetcher() as prefetcher:
+            prefetcher.submit(urls)
+            for source in sources:
+                try:
+                    image_data = None
+                    if source in urls:
+                        print(f"Downloading: {source}")
+                        try:
+                            image_data = prefetcher.result(source)
+                        except Exception as exc:
+                            raise RuntimeError(f"Failed to download image from {source}: {exc}")
+                    output_path = convert_image(source, args.output, args.target_kb, image_data, args.format)
+                    converted.append(output_path)
+                except Exception as exc:
+                    print(f"ERROR: {exc}", file=sys.stderr)
+                    failed.append(source)
+    else:
+        # WebP encoding holds the GIL, so fan out across processes; map()
+        # yields in submission order, which keeps the progress log ordered.
+        with ProcessPoolExecutor(max_workers=min(jobs, len(sources))) as pool:
+            results = pool.map(
+                convert_image_captured,
+                sources,
+                [args.output] * len(sources),
+                [args.target_kb] * len(sources),
+                [args.format] * len(sources),
+            )
+            for index, (source, output_path, log, error) in enumerate(results, start=1):
+                print(f"[{index}/{len(sources)}] {source}")
+                print(log, end="")
+                if error is None:
+                    converted.append(output_path)
+                else:
+                    print(f"ERROR: {error}", file=sys.stderr)
+                    failed.append(source)
     
     # Summary
     print(f"\n{'='*60}")
-    print(f"Converted: {len(converted)}/{len(args.images)} images")
+    print(f"Converted: {len(converted)}/{len(sources)} images")
     if failed:
         print(f"Failed: {len(failed)} images")
         for img in failed:
@@ -6,22 +6,47 @@ Generate a daily Chirpy blog post from monthly topics and create a thumbnail ima
 from __future__ import annotations
 
 import argparse
-import io
 import json
 import os
 import re
 import sys
+import threading
+import time
 import uuid
-import requests
-from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, date, timedelta
+from itertools import zip_longest
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 
-import yaml
 from google import genai
 from PIL import Image
 from google.genai import types
 
+from front_matter import render_post
+from http_client import Prefetcher, fetch_bytes
+from genai_cache import cached_text, generate_text
+from image_cache import ImageCache, sha256_hex
+from image_codec import (
+    FORMATS,
+    OUTPUT_FORMATS,
+    PROFILES,
+    decode_for_profile,
+    encode_alternate,
+    encode_with_profile,
+    rank_with_profile,
+    webp_within_budget,
+)
+from image_hashes import HashIndex
+from image_metadata import describe
+from image_ranker import MIN_SCORE, default_ranker, rank_candidates, record_choice
+from image_variants import VARIANT_WIDTHS, alias_variants, encode_variants, save_variants, web_path_of
+from model_health import order_models, record_failure, record_success
+from pexels_client import pick_rendition, search_photos
+from post_index import PostIndex
+from stage_runner import RateLimiter, StageRunner, in_current_stage, request_timeout
+
 BLOG_MODEL_PRIMARY = os.environ.get("GEMINI_BLOG_MODEL_PRIMARY", "gemini-3.1-pro")
 BLOG_MODEL_FALLBACK = os.environ.get("GEMINI_BLOG_MODEL_FALLBACK", "gemini-2.5-pro")
 KEYWORD_MODEL = os.environ.get("GEMINI_KEYWORD_MODEL", "gemini-2.5-flash")
@@ -30,22 +55,171 @@ ASSETS_DIR = Path(__file__).resolve().parent.parent / "assets" / "img"
 TOPICS_DIR = Path(__file__).resolve().parent.parent / "topics"
 PEXELS_API_KEY = os.environ.get("PEXELS_API_KEY")
 UNSPLASH_ACCESS_KEY = os.environ.get("UNSPLASH_ACCESS_KEY")
-IMAGE_MAX_KB = int(os.environ.get("IMAGE_MAX_KB", "60"))
-MAX_DIMENSIONS = (1280, 720)
+THUMBNAIL = PROFILES["thumbnail"]
+IMAGE_MAX_KB = THUMBNAIL.max_kb
+MAX_DIMENSIONS = THUMBNAIL.max_dimensions
+IMAGE_CACHE = ImageCache()
+HASH_INDEX = HashIndex(ASSETS_DIR)
+PIPELINE_DEADLINE_SECONDS = float(os.environ.get("PIPELINE_DEADLINE_SECONDS", "900"))
+# Thumbnail ranking: "local" (offline only), "auto" (text model when unsure) or "llm"
+IMAGE_RANKER = os.environ.get("IMAGE_RANKER", "local")
+# Query variants searched concurrently on the first try (1 searches only the image prompt)
+PEXELS_QUERY_VARIANTS = int(os.environ.get("PEXELS_QUERY_VARIANTS", "2"))
+# Upper bound on Pexels searches per image, variants and refinements included; the
+# default matches the old three sequential tries so the monthly quota lasts as long
+PEXELS_MAX_SEARCHES = int(os.environ.get("PEXELS_MAX_SEARCHES", "3"))
+# Top-ranked candidates downloaded while ranking runs, and the total bytes they may use
+PEXELS_PREFETCH_COUNT = int(os.environ.get("PEXELS_PREFETCH_COUNT", "3"))
+PEXELS_PREFETCH_MB = float(os.environ.get("PEXELS_PREFETCH_MB", "6"))
+GEMINI_LIMITER = RateLimiter(float(os.environ.get("GEMINI_RPM", "15")))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "3"))
+# Serializes picking a unique post filename across batch workers
+_POST_PATH_LOCK = threading.Lock()
+# Placeholders look alike by design, so save_webp never matches them against stored images
+_PLACEHOLDERS: set[bytes] = set()
+# Images from --image-url are used as given, never swapped for a stored near-duplicate
+_USER_SUPPLIED: set[bytes] = set()
 
 
 def placeholder_image_bytes(color: tuple[int, int, int] = (220, 225, 230)) -> bytes:
     placeholder = Image.new("RGB", MAX_DIMENSIONS, color=color)
-    return compress_image_to_webp_bytes(placeholder)
+    data = compress_image_to_webp_bytes(placeholder)
+    _PLACEHOLDERS.add(data)
+    return data
 
 
 def fetch_image(
-    url: str, headers: Dict[str, str] | None = None, timeout: int = 20
+    url: str, headers: Dict[str, str] | None = None, timeout: float | None = None
 ) -> bytes | None:
     try:
-        resp = requests.get(url, headers=headers or {}, timeout=timeout)
-        resp.raise_for_status()
-        return resp.content
+        return fetch_bytes(url, headers=headers, timeout=timeout)
+    except Exception as exc:
+        print(f"Download failed for {url}: {exc}")
+        return None
+
+
+def webp_encode_params(target_kb: int = IMAGE_MAX_KB) -> Dict[str, Any]:
+    return {
+        "codec": THUMBNAIL.fmt,
+        "profile": THUMBNAIL.name,
+        "max_dimensions": MAX_DIMENSIONS,
+        "resample": THUMBNAIL.resample.name,
+        "target_kb": target_kb,
+    }
+
+
+def alternate_params(fmt: str) -> Dict[str, Any]:
+    return {"codec": fmt, "alternate_of": "webp", "profile": THUMBNAIL.name}
+
+
+def variant_params(width: int, budget_kb: int) -> Dict[str, Any]:
+    return {"codec": "webp", "variant_of": "webp", "width": width, "target_kb": budget_kb}
+
+
+def thumbnail_outputs(
+    webp: bytes, image: Image.Image | None = None
+) -> Tuple[Dict[str, Any], List[Tuple[int, bytes]]]:
+    """(describe() metadata, srcset variants) for the final WebP, cached under its hash.
+
+    A re-run that ends up with the same WebP skips the decode and every
+    variant encode; image, when given, saves decoding webp on a miss.
+    """
+    content_hash = sha256_hex(webp)
+    outputs_params = {"outputs_of": "webp", "variant_widths": VARIANT_WIDTHS}
+    cached = IMAGE_CACHE.get_encoded(content_hash, outputs_params)
+    if cached is not None:
+        outputs = json.loads(cached)
+        variants: List[Tuple[int, bytes]] = []
+        for width, budget_kb in outputs["variants"]:
+            data = IMAGE_CACHE.get_encoded(content_hash, variant_params(width, budget_kb))
+            if data is None:
+                break
+            variants.append((width, data))
+        else:
+            return outputs["metadata"], variants
+
+    if image is None:
+        image = decode_for_profile(webp, THUMBNAIL)
+    metadata = describe(image)
+    variants = encode_variants(image)
+    budgets = dict(VARIANT_WIDTHS)
+    for width, data in variants:
+        IMAGE_CACHE.put_encoded(content_hash, variant_params(width, budgets[width]), data)
+    outputs = {"metadata": metadata, "variants": [[width, budgets[width]] for width, _ in variants]}
+    IMAGE_CACHE.put_encoded(content_hash, outputs_params, json.dumps(outputs).encode("utf-8"))
+    return metadata, variants
+
+
+def encode_thumbnail(data: bytes, target_kb: int = IMAGE_MAX_KB) -> bytes:
+    """Encode a downloaded source to the thumbnail WebP.
+
+    Any better-compressing alternate is encoded from the same source decode
+    and cached under the WebP's hash, so save_webp can write it later
+    without a second-generation encode. An empty blob records "no
+    alternate beats the WebP".
+    """
+    image = decode_for_profile(data, THUMBNAIL)
+    webp = compress_image_to_webp_bytes(image, target_kb)
+    if len(OUTPUT_FORMATS) > 1:
+        alternate = encode_alternate(image, webp)
+        for name in OUTPUT_FORMATS:
+            if name != "webp":
+                encoded = alternate[1] if alternate and alternate[0] == name else b""
+                IMAGE_CACHE.put_encoded(sha256_hex(webp), alternate_params(name), encoded)
+    return webp
+
+
+def cached_alternate(webp: bytes) -> Tuple[bool, Tuple[str, bytes] | None]:
+    """(found, (format, bytes) or None) for the alternate cached by encode_thumbnail."""
+    found = False
+    for name in OUTPUT_FORMATS:
+        if name == "webp":
+            continue
+        data = IMAGE_CACHE.get_encoded(sha256_hex(webp), alternate_params(name))
+        if data is None:
+            continue
+        found = True
+        if data:
+            return True, (name, data)
+    return found, None
+
+
+def prefetched(prefetcher: Prefetcher | None, url: str) -> bytes | None:
+    """Bytes of url if it was prefetched, waiting for a download still in flight."""
+    if prefetcher is None or not prefetcher.submitted(url):
+        return None
+    try:
+        return prefetcher.result(url)
+    except Exception as exc:
+        print(f"Prefetch failed for {url} ({exc}); downloading it directly.")
+        return None
+
+
+def fetch_webp(
+    url: str,
+    headers: Dict[str, str] | None = None,
+    target_kb: int = IMAGE_MAX_KB,
+    prefetcher: Prefetcher | None = None,
+    prefetched_only: bool = False,
+) -> bytes | None:
+    """Download url and compress it to WebP, reusing prefetched bytes, cached downloads and encodes.
+
+    With prefetched_only, a URL that was not (successfully) prefetched is
+    skipped rather than downloaded.
+    """
+
+    def encode(data: bytes) -> bytes:
+        return encode_thumbnail(data, target_kb)
+
+    try:
+        data = prefetched(prefetcher, url)
+        if data is not None:
+            return IMAGE_CACHE.encoded_from_download(url, webp_encode_params(target_kb), encode, data)
+        if prefetched_only:
+            return None
+        return IMAGE_CACHE.encoded_from_url(
+            url, webp_encode_params(target_kb), encode, headers=headers
+        )
     except Exception as exc:
         print(f"Download failed for {url}: {exc}")
         return None
@@ -54,18 +228,8 @@ def fetch_image(
 def compress_image_to_webp_bytes(
     image: Image.Image, target_kb: int = IMAGE_MAX_KB
 ) -> bytes:
-    # Resize to max dimensions while preserving aspect ratio
-    img = image.copy()
-    img.thumbnail(MAX_DIMENSIONS)
-    best_bytes = None
-    for quality in (80, 70, 60, 50, 40, 30):
-        buffer = io.BytesIO()
-        img.save(buffer, format="WEBP", quality=quality, method=6)
-        data = buffer.getvalue()
-        best_bytes = data
-        if len(data) <= target_kb * 1024:
-            break
-    return best_bytes or b""
+    data, _ = encode_with_profile(image, THUMBNAIL.with_budget(target_kb))
+    return data
 
 
 def pexels_search_candidates(prompt: str, per_page: int = 6) -> List[Dict[str, Any]]:
@@ -78,37 +242,24 @@ def pexels_search_candidates(prompt: str, per_page: int = 6) -> List[Dict[str, A
             "To enable Pexels image search, get a free API key from https://www.pexels.com/api/"
         )
         return []
-    headers = {"Authorization": PEXELS_API_KEY}
-    params = {"query": prompt, "per_page": per_page, "orientation": "landscape"}
     try:
-        resp = requests.get(
-            "https://api.pexels.com/v1/search",
-            headers=headers,
-            params=params,
-            timeout=20,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        photos = data.get("photos") or []
+        photos = search_photos(PEXELS_API_KEY, prompt, per_page=per_page)
         results = []
         for photo in photos:
-            src = photo.get("src", {})
-            # Prefer a ~1k-1.5k wide asset; fallback to anything available
-            url = (
-                src.get("large2x")
-                or src.get("large")
-                or src.get("original")
-                or src.get("medium")
-                or src.get("small")
-            )
-            if not url:
+            # The smallest rendition that still covers the thumbnail size
+            rendition = pick_rendition(photo, MAX_DIMENSIONS)
+            if not rendition:
                 continue
             results.append(
                 {
                     "id": photo.get("id"),
                     "alt": photo.get("alt") or "",
                     "photographer": photo.get("photographer") or "",
-                    "url": url,
+                    "width": photo.get("width"),
+                    "height": photo.get("height"),
+                    "src": photo.get("src") or {},
+                    "rendition": rendition[0],
+                    "url": rendition[1],
                 }
             )
         print(f"Pexels search for '{prompt}' returned {len(results)} candidate(s).")
@@ -147,73 +298,179 @@ def choose_image_with_ai(
             + '\nRespond as JSON: {"choice": <index or null>, "new_query": <string or null>}'
             "\nChoose the best tech-relevant image. If none fit, set choice=null and suggest a better concise query."
         )
-        resp = operations_client.models.generate_content(
-            model=KEYWORD_MODEL,
-            contents=prompt,
-            config={"response_mime_type": "application/json"},
-        )
-        raw = getattr(resp, "text", None)
-        if not raw and getattr(resp, "candidates", None):
-            parts = (
-                getattr(resp.candidates[0].content, "parts", [])
-                if resp.candidates[0].content
-                else []
+        # Only fresh answers are labels; a cached one was recorded when it was made
+        raw = cached_text(KEYWORD_MODEL, prompt, "application/json")
+        fresh = raw is None
+        if fresh:
+            raw = generate_text(
+                operations_client,
+                KEYWORD_MODEL,
+                prompt,
+                "application/json",
+                limiter=GEMINI_LIMITER,
+                bypass=True,
+                timeout=request_timeout(),
             )
-            if parts and getattr(parts[0], "text", None):
-                raw = parts[0].text
         if not raw:
             raise RuntimeError("No JSON response from text model for image ranking.")
         data = json.loads(raw)
+        if fresh:
+            record_choice(candidates, query, title, data.get("choice"))
         return data.get("choice"), data.get("new_query")
     except Exception as exc:
-        print(f"AI ranking failed: {exc}; defaulting to first candidate.")
-        return 0, None
+        print(f"AI ranking failed: {exc}; using the local ranking.")
+        choice, _, _ = rank_candidates(candidates, query, title)
+        return (0 if choice is None else choice), None
+
+
+def choose_image(
+    candidates: List[Dict[str, Any]], query: str, title: str
+) -> Tuple[int | None, str | None]:
+    """Pick a candidate with the offline ranker, asking the text model only when IMAGE_RANKER allows."""
+    if IMAGE_RANKER != "llm":
+        choice, new_query, score = rank_candidates(candidates, query, title)
+        if IMAGE_RANKER != "auto" or score >= MIN_SCORE:
+            return choice, new_query
+        print(f"Local ranking is unsure (score {score:.2f}); asking the text model.")
+    return choose_image_with_ai(candidates, query, title)
+
+
+def query_variants(prompt: str, title: str, tags: List[str] | None = None) -> List[str]:
+    """Distinct Pexels queries from the image prompt, the title and the tags, best guess first."""
+    variants = [f"{prompt} technology illustration", f"{title} technology"]
+    if tags:
+        variants.append(f"{' '.join(tags[:3])} technology")
+    unique: Dict[str, str] = {}
+    for variant in variants:
+        unique.setdefault(" ".join(variant.lower().split()), variant)
+    # Leave one search of the PEXELS_MAX_SEARCHES budget for a refined query
+    return list(unique.values())[: max(1, min(PEXELS_QUERY_VARIANTS, PEXELS_MAX_SEARCHES - 1))]
+
+
+def search_candidates_concurrently(queries: List[str]) -> List[Dict[str, Any]]:
+    """Run the searches in parallel and merge their results, deduplicated by photo id.
+
+    Results are interleaved so each query's top hits come before anyone's
+    lower-ranked ones.
+    """
+    if len(queries) == 1:
+        return pexels_search_candidates(queries[0])
+    with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="pexels") as pool:
+        results = list(pool.map(in_current_stage(pexels_search_candidates), queries))
+    merged: List[Dict[str, Any]] = []
+    seen = set()
+    for row in zip_longest(*results):
+        for candidate in row:
+            if candidate is None:
+                continue
+            key = candidate.get("id") or candidate["url"]
+            if key not in seen:
+                seen.add(key)
+                merged.append(candidate)
+    return merged
 
 
-def pexels_select_image(prompt: str, title: str) -> bytes | None:
-    """Search Pexels, let AI pick/iterate up to 3 tries, and return image bytes if found."""
+def prefetch_candidates(
+    prefetcher: Prefetcher, candidates: List[Dict[str, Any]], query: str, title: str
+) -> None:
+    """Start downloading the locally top-ranked candidates that are not cached yet.
+
+    Only a text-model ranking takes long enough to hide downloads behind, so
+    PEXELS_PREFETCH_COUNT candidates are fetched only when one will run.
+    Otherwise the local winner and one fallback download together.
+    """
+    if PEXELS_PREFETCH_COUNT <= 0:
+        return
+    ranked = default_ranker().rank(candidates, query, title)
+    asks_model = IMAGE_RANKER == "llm" or (IMAGE_RANKER == "auto" and ranked[0][0] < MIN_SCORE)
+    count = PEXELS_PREFETCH_COUNT if asks_model else min(2, PEXELS_PREFETCH_COUNT)
+    urls = [candidates[index]["url"] for _, index in ranked]
+    urls = [url for url in urls if not IMAGE_CACHE.has_encoded(url, webp_encode_params())]
+    prefetcher.submit(urls[:count])
+
+
+def pexels_select_image(prompt: str, title: str, tags: List[str] | None = None) -> bytes | None:
+    """Search Pexels, rank the results and iterate up to 3 tries, and return image bytes if found.
+
+    The first try searches every query variant at once and ranks the merged
+    pool; later tries search the refined query. At most PEXELS_MAX_SEARCHES
+    searches are made per image. The top candidates download while the
+    text model ranks them (see prefetch_candidates); only the chosen one is
+    decoded and the rest are discarded.
+    """
     if not PEXELS_API_KEY:
         print("WARNING: Cannot search Pexels - PEXELS_API_KEY not set.")
         return None
-    query = f"{prompt} technology illustration"
-    print(f"Searching Pexels for: '{query}'")
+    count = max(1, PEXELS_PREFETCH_COUNT)
+    with Prefetcher(
+        max_workers=count,
+        headers={"Authorization": PEXELS_API_KEY},
+        max_bytes=int(PEXELS_PREFETCH_MB * 1024 * 1024 / count),
+    ) as prefetcher:
+        return select_pexels_image(prompt, title, tags, prefetcher)
+
+
+def select_pexels_image(
+    prompt: str, title: str, tags: List[str] | None, prefetcher: Prefetcher
+) -> bytes | None:
+    queries = query_variants(prompt, title, tags)
+    searches = 0
     fallback_candidate: Dict[str, Any] | None = None
     for attempt in range(3):
-        candidates = pexels_search_candidates(query)
+        queries = queries[: max(0, PEXELS_MAX_SEARCHES - searches)]
+        if not queries:
+            print(f"Reached PEXELS_MAX_SEARCHES ({PEXELS_MAX_SEARCHES}) for this image.")
+            break
+        for query in queries:
+            print(f"Searching Pexels for: '{query}'")
+        searches += len(queries)
+        query = " | ".join(queries)
+        candidates = search_candidates_concurrently(queries)
         if candidates:
             if fallback_candidate is None:
                 fallback_candidate = candidates[0]
-            choice, new_query = choose_image_with_ai(candidates, query, title)
+            prefetch_candidates(prefetcher, candidates, query, title)
+            choice, new_query = choose_image(candidates, query, title)
             candidate = None
             if choice is not None and 0 <= choice < len(candidates):
                 candidate = candidates[choice]
             elif new_query and attempt < 2:
-                query = new_query
+                queries = [new_query]
                 continue
             else:
                 candidate = candidates[0]
 
-            data = fetch_image(
-                candidate["url"], headers={"Authorization": PEXELS_API_KEY}
+            data = fetch_webp(
+                candidate["url"], headers={"Authorization": PEXELS_API_KEY}, prefetcher=prefetcher
             )
+            if not data:
+                print(f"Failed to download image from URL: {candidate['url']}")
+                # Fall through to a candidate that has already arrived
+                by_url = {other["url"]: other for other in candidates}
+                ready = [url for url in prefetcher.succeeded() if url in by_url and url != candidate["url"]]
+                if ready:
+                    candidate = by_url[ready[0]]
+                    print(f"Using prefetched candidate instead: {candidate['url']}")
+                    data = fetch_webp(
+                        candidate["url"], headers={"Authorization": PEXELS_API_KEY}, prefetcher=prefetcher
+                    )
             if data:
+                candidate, data = prefer_unique(candidates, candidate, data, prefetcher)
                 print(
                     f"Successfully downloaded image from Pexels (photographer: {candidate.get('photographer', 'unknown')})"
                 )
                 return data
-            else:
-                print(f"Failed to download image from URL: {candidate['url']}")
             if new_query and attempt < 2:
-                query = new_query
-                print(f"Refining search query to: '{query}'")
+                queries = [new_query]
+                print(f"Refining search query to: '{new_query}'")
                 continue
         elif attempt < 2:
             continue
 
     if fallback_candidate:
         print("Attempting to download fallback candidate...")
-        data = fetch_image(
-            fallback_candidate["url"], headers={"Authorization": PEXELS_API_KEY}
+        data = fetch_webp(
+            fallback_candidate["url"], headers={"Authorization": PEXELS_API_KEY}, prefetcher=prefetcher
         )
         if data:
             print("Successfully downloaded fallback image from Pexels")
@@ -222,6 +479,41 @@ def pexels_select_image(prompt: str, title: str) -> bytes | None:
     return None
 
 
+def prefer_unique(
+    candidates: List[Dict[str, Any]],
+    chosen: Dict[str, Any],
+    data: bytes,
+    prefetcher: Prefetcher | None = None,
+) -> Tuple[Dict[str, Any], bytes]:
+    """Swap a chosen photo that is already stored under another slug for the next unused candidate.
+
+    Only candidates prefetched while ranking ran are tried, so this never
+    adds serial downloads. If none of them is unique the original choice is
+    kept, and save_webp reuses the stored file instead of adding a copy.
+    """
+    HASH_INDEX.refresh()
+    duplicate = HASH_INDEX.similar(data)
+    if not duplicate:
+        return chosen, data
+    print(f"Chosen photo duplicates assets/img/{duplicate[0][0]}; trying other candidates.")
+    others = [
+        candidate
+        for candidate in candidates
+        if candidate is not chosen and prefetcher is not None and prefetcher.submitted(candidate["url"])
+    ]
+    for candidate in others[:PEXELS_PREFETCH_COUNT]:
+        other = fetch_webp(
+            candidate["url"],
+            headers={"Authorization": PEXELS_API_KEY},
+            prefetcher=prefetcher,
+            prefetched_only=True,
+        )
+        if other and not HASH_INDEX.similar(other):
+            return candidate, other
+    print("No prefetched candidate is unique; the existing image will be reused.")
+    return chosen, data
+
+
 def load_text_key() -> str:
     """Load API key for blog content generation (uses primary models)."""
     key = os.environ.get("GEMINI_API_KEY")
@@ -273,20 +565,14 @@ def suggest_metadata(title: str, description: str) -> Dict[str, Any]:
         "\nRespond as JSON with keys: title (catchy, professional blog title if not provided), category (one short word), tags (3-6 items, kebab-case), permalink_slug (kebab-case), image_prompt (concise), description (highly SEO-optimized for Google and AI search, engaging, <=160 chars)."
     )
     try:
-        resp = operations_client.models.generate_content(
-            model=KEYWORD_MODEL,
-            contents=prompt,
-            config={"response_mime_type": "application/json"},
+        raw = generate_text(
+            operations_client,
+            KEYWORD_MODEL,
+            prompt,
+            "application/json",
+            limiter=GEMINI_LIMITER,
+            timeout=request_timeout(),
         )
-        raw = getattr(resp, "text", None)
-        if not raw and getattr(resp, "candidates", None):
-            parts = (
-                getattr(resp.candidates[0].content, "parts", [])
-                if resp.candidates[0].content
-                else []
-            )
-            if parts and getattr(parts[0], "text", None):
-                raw = parts[0].text
         if not raw:
             raise RuntimeError("Empty metadata response")
         return json.loads(raw)
@@ -361,17 +647,31 @@ def request_markdown(client: genai.Client, prompt: str) -> str:
         "gemini-1.5-flash"
     ]
     
-    last_exc = None
+    # A retried run reuses whichever model answered last time
     for model_name in models_to_try:
+        cached = cached_text(model_name, prompt, "text/plain")
+        if cached:
+            return cached
+
+    last_exc = None
+    for model_name in order_models(models_to_try):
+        timeout = request_timeout()
+        started = time.monotonic()
         try:
-            response = client.models.generate_content(
-                model=model_name,
-                contents=prompt,
-                config={"response_mime_type": "text/plain"},
+            text = generate_text(
+                client,
+                model_name,
+                prompt,
+                "text/plain",
+                limiter=GEMINI_LIMITER,
+                bypass=True,
+                timeout=timeout,
             )
-            if hasattr(response, "text") and response.text:
-                return str(response.text)
+            if text:
+                record_success(model_name, time.monotonic() - started)
+                return text
         except Exception as exc:
+            record_failure(model_name, exc, time.monotonic() - started)
             print(f"Model '{model_name}' failed ({exc}). Trying next...")
             last_exc = exc
             
@@ -381,37 +681,60 @@ def request_markdown(client: genai.Client, prompt: str) -> str:
 def process_image_url(url: str, target_kb: int = IMAGE_MAX_KB) -> bytes:
     """Download image from URL and convert to optimized WebP."""
     print(f"Downloading custom image from: {url}")
-    data = fetch_image(url)
-    if not data:
-        raise RuntimeError(f"Failed to download image from {url}")
+
+    def encode(data: bytes) -> bytes:
+        return encode_thumbnail(data, target_kb)
 
     try:
-        image = Image.open(io.BytesIO(data))
-        webp_bytes = compress_image_to_webp_bytes(image, target_kb)
-        print(f"Successfully processed custom image ({len(webp_bytes) / 1024:.1f}KB)")
-        return webp_bytes
+        webp_bytes = IMAGE_CACHE.encoded_from_url(url, webp_encode_params(target_kb), encode)
     except Exception as exc:
         raise RuntimeError(f"Failed to process image from {url}: {exc}")
+    print(f"Successfully processed custom image ({len(webp_bytes) / 1024:.1f}KB)")
+    return webp_bytes
 
 
 def request_image(
-    prompt: str, title: str, custom_image_url: str | None = None
+    prompt: str, title: str, custom_image_url: str | None = None, tags: List[str] | None = None
 ) -> bytes:
     """Get image for blog post - custom URL, Pexels, or placeholder."""
+    # A retried run for the same post reuses the earlier result outright.
+    # A custom URL's image is stored under its own key, so a cached hit there
+    # is always the user's image and never a stock fallback.
+    def key_for(url: str | None) -> str:
+        return sha256_hex(
+            json.dumps([prompt, title, url, webp_encode_params(), tags or []]).encode("utf-8")
+        )
+
     # If custom image URL provided, use it
     if custom_image_url:
+        custom_key = key_for(custom_image_url)
+        webp_bytes = IMAGE_CACHE.get_request(custom_key)
+        if webp_bytes:
+            print("Using cached image from an earlier run.")
+            _USER_SUPPLIED.add(webp_bytes)
+            return webp_bytes
         try:
-            return process_image_url(custom_image_url)
+            webp_bytes = process_image_url(custom_image_url)
+            IMAGE_CACHE.put_request(custom_key, webp_bytes)
+            _USER_SUPPLIED.add(webp_bytes)
+            return webp_bytes
         except Exception as exc:
             print(
                 f"WARNING: Custom image URL failed ({exc}); falling back to stock search."
             )
 
-    # Pexels stock photo search with AI ranking/iteration
+    request_key = key_for(None)
+    cached = IMAGE_CACHE.get_request(request_key)
+    if cached:
+        print("Using cached image from an earlier run.")
+        return cached
+
+    # Pexels stock photo search with local (optionally AI) ranking/iteration
     print("Attempting to find stock photo from Pexels...")
-    stock_bytes = pexels_select_image(prompt, title)
+    stock_bytes = pexels_select_image(prompt, title, tags)
     if stock_bytes:
         print("Using stock photo from Pexels.")
+        IMAGE_CACHE.put_request(request_key, stock_bytes)
         return stock_bytes
 
     print("WARNING: Stock photo search failed. Using placeholder image.")
@@ -419,12 +742,70 @@ def request_image(
     return placeholder_image_bytes()
 
 
-def save_webp(image_bytes: bytes, destination: Path) -> str:
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write via a temp file and rename so readers never see a partial file."""
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def save_webp(image_bytes: bytes, destination: Path) -> Dict[str, Any]:
+    """Write the thumbnail and return its `image` front matter (path, LQIP, size, colour).
+
+    The WebP is always written so every browser has a `path` to load. When
+    another output format matches its quality in fewer bytes, it is written
+    alongside and listed under `sources` for a <picture> element. That
+    alternate comes from the source download (see encode_thumbnail); only
+    a WebP with nothing cached is ranked against other formats here. Metadata
+    and srcset variants come from thumbnail_outputs, so a WebP served from
+    the cache is not decoded at all.
+    """
     destination.parent.mkdir(parents=True, exist_ok=True)
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    data = compress_image_to_webp_bytes(image)
-    destination.write_bytes(data)
-    return destination.name
+    reusable = image_bytes not in _PLACEHOLDERS and image_bytes not in _USER_SUPPLIED
+    duplicate = HASH_INDEX.find_duplicate(image_bytes) if reusable else None
+    if duplicate is not None:
+        # Point the post at the stored copy rather than adding the same photo again
+        existing = ASSETS_DIR / duplicate
+        print(f"Reusing near-duplicate image assets/img/{duplicate}")
+        with Image.open(existing) as stored:
+            front_matter = {"path": duplicate, **describe(stored)}
+        sources = [
+            {"path": Path(duplicate).with_suffix(FORMATS[name].extension).as_posix(), "type": FORMATS[name].mime_type}
+            for name in OUTPUT_FORMATS
+            if name != "webp" and existing.with_suffix(FORMATS[name].extension).exists()
+        ]
+        if sources:
+            front_matter["sources"] = sources
+        alias_variants(web_path_of(existing), duplicate)
+        return front_matter
+    image = None
+    if webp_within_budget(image_bytes, IMAGE_MAX_KB * 1024, MAX_DIMENSIONS):
+        # Already compressed by request_image; re-encoding would only lose quality.
+        webp = image_bytes
+        found, alternate = cached_alternate(webp)
+        if not found and len(OUTPUT_FORMATS) > 1:
+            image = decode_for_profile(image_bytes, THUMBNAIL)
+            others = [name for name in OUTPUT_FORMATS if name != "webp"]
+            ranked = rank_with_profile(image, THUMBNAIL.with_budget(len(webp) // 1024), others)
+            alternate = (ranked[0].fmt, ranked[0].data) if ranked else None
+    else:
+        image = decode_for_profile(image_bytes, THUMBNAIL)
+        webp = compress_image_to_webp_bytes(image)
+        alternate = encode_alternate(image, webp) if len(OUTPUT_FORMATS) > 1 else None
+    write_atomic(destination, webp)
+    metadata, variants = thumbnail_outputs(webp, image)
+    # Smaller srcset candidates for mobile readers, keyed by `image.path` as
+    # written below, which is relative to media_subpath
+    save_variants(destination, web_path_of(destination), metadata["width"], variants, [destination.name])
+    front_matter = {"path": destination.name, **metadata}
+    # An alternate is only worth listing if it also saves bytes over the fallback
+    if alternate and len(alternate[1]) < len(webp):
+        best = FORMATS[alternate[0]]
+        path = destination.with_suffix(best.extension)
+        write_atomic(path, alternate[1])
+        front_matter["sources"] = [{"path": path.name, "type": best.mime_type}]
+        print(f"Using {best.name.upper()} ({len(alternate[1]) / 1024:.1f}KB) with a WebP fallback")
+    return front_matter
 
 
 def build_front_matter(
@@ -432,7 +813,7 @@ def build_front_matter(
     permalink: str,
     category: str,
     tags: List[str],
-    image_path: str,
+    image: Dict[str, Any],
     description_prompt: str,
     timestamp: str,
 ) -> Dict[str, Any]:
@@ -451,7 +832,7 @@ def build_front_matter(
         "date": timestamp,
         "categories": [category],
         "tags": tags,
-        "image": image_path,
+        "image": image,
         "description": description_prompt[:180],
         "video_id": "",
         "playlist_id": "",
@@ -462,7 +843,6 @@ def build_front_matter(
 def write_post(
     path: Path, front_matter: Dict[str, Any], body: str, resources: List[str]
 ) -> None:
-    yaml_block = yaml.safe_dump(front_matter, sort_keys=False, allow_unicode=False)
     extra = ""
     if resources:
         # Format resources as proper markdown links
@@ -480,8 +860,158 @@ def write_post(
 
         links = "\n".join(f"- {link}" for link in formatted_links)
         extra = f"\n\n## Further Reading\n\n{links}\n"
-    content = f"---\n{yaml_block}---\n\n{body.strip()}\n{extra}"
-    path.write_text(content, encoding="utf-8")
+    write_atomic(path, (render_post(front_matter, body) + extra).encode("utf-8"))
+
+
+@dataclass
+class PostPlan:
+    target_date: date
+    title: str
+    permalink: str
+    category: str
+    tags: List[str]
+    body_instructions: str
+    image_prompt_base: str
+    resources: List[str] = field(default_factory=list)
+    # None means the description is generated as a stage of generate_post
+    meta_description: str | None = None
+    image_url: str | None = None
+
+
+def plan_from_topic(target_date: date, topic: Dict[str, Any]) -> PostPlan:
+    title = str(topic.get("title") or "Technical Insight").strip()
+    tags = [str(t).lower().strip() for t in topic.get("tags", []) if str(t).strip()]
+    if not tags:
+        tags = slugify(title).split("-")[:6]
+    return PostPlan(
+        target_date=target_date,
+        title=title,
+        permalink=slugify(topic.get("permalink") or title),
+        category=str(topic.get("category") or "Tech").strip(),
+        tags=tags,
+        # For automated topics, description_prompt is essentially the instructions
+        body_instructions=str(topic.get("description_prompt") or "Concise overview.").strip(),
+        image_prompt_base=str(topic.get("image_prompt") or f"Hero image for {title}").strip(),
+        resources=topic.get("resources") or [],
+    )
+
+
+def generate_post(
+    client: genai.Client, plan: PostPlan, runner: StageRunner, parallel: bool
+) -> Path:
+    """Run the image, body (and, if needed, description) stages and write the post."""
+    image_prompt = f"{plan.image_prompt_base}. 1280x720, Nano Banana style, cinematic lighting, detailed."
+    body_prompt = build_body_prompt(
+        {
+            "title": plan.title,
+            "description_prompt": plan.body_instructions,
+            "resources": plan.resources,
+        }
+    )
+    stages: Dict[str, Callable[[], Any]] = {}
+
+    if plan.meta_description is None:
+        # Use the suggest_metadata function to get a clean description instead of the raw instruction prompt.
+        # Nothing else depends on it here, so it runs as a stage alongside image and body.
+        def metadata_stage() -> str:
+            try:
+                suggested = suggest_metadata(plan.title, plan.body_instructions)
+                return suggested.get("description") or plan.body_instructions[:180]
+            except Exception as e:
+                print(f"Failed to generate metadata for description: {e}")
+                return plan.body_instructions[:180]
+
+        stages["metadata"] = metadata_stage
+
+    # Generate image using Pexels
+    def image_stage() -> Dict[str, Any]:
+        image_bytes = request_image(image_prompt, plan.title, plan.image_url, plan.tags)
+        runner.check()
+        return save_webp(image_bytes, ASSETS_DIR / f"{plan.permalink}.webp")
+
+    # The post body uses the text key and does not depend on the image
+    stages["image"] = image_stage
+    stages["body"] = lambda: request_markdown(client, body_prompt)
+    results = runner.run_all(stages, parallel=parallel)
+    image = results["image"]
+    meta_description = results.get("metadata", plan.meta_description)
+
+    # Backfilled posts are dated on their own day, at the time they were written
+    now = datetime.now().astimezone()
+    timestamp = datetime.combine(plan.target_date, now.timetz()).strftime("%Y-%m-%d %H:%M:%S %z")
+
+    front_matter = build_front_matter(
+        plan.title,
+        plan.permalink,
+        plan.category,
+        plan.tags,
+        image,
+        meta_description,
+        timestamp,
+    )
+
+    filename = f"{plan.target_date.strftime('%Y-%m-%d')}-{plan.permalink}.md"
+    with _POST_PATH_LOCK:
+        destination = ensure_unique_path(POSTS_DIR / filename)
+        write_post(destination, front_matter, results["body"], plan.resources)
+    print(f"Generated post: {destination}")
+    print(f"Thumbnail: {image['path']}")
+    return destination
+
+
+def run_batch(
+    client: genai.Client,
+    start: date,
+    end: date,
+    workers: int,
+    parallel: bool,
+    deadline: float,
+) -> None:
+    """Generate one post per day in [start, end], several days at a time."""
+    if end < start:
+        raise SystemExit("--to must not be earlier than --from")
+
+    index = PostIndex(POSTS_DIR).refresh()
+    topics_by_month: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+    plans: List[PostPlan] = []
+    day = start
+    while day <= end:
+        if index.by_date(day.isoformat()):
+            print(f"Skipping {day}: a post already exists.")
+        else:
+            month_key = (day.month, day.year)
+            if month_key not in topics_by_month:
+                topics_by_month[month_key] = read_topics(day.month, day.year)
+            plans.append(plan_from_topic(day, pick_topic(topics_by_month[month_key], day.day)))
+        day += timedelta(days=1)
+
+    def run_one(plan: PostPlan) -> Path:
+        runner = StageRunner(deadline)
+        try:
+            return generate_post(client, plan, runner, parallel)
+        finally:
+            runner.report(plan.target_date.isoformat())
+
+    generated: List[Path] = []
+    failed: List[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="day") as pool:
+        futures = [(plan, pool.submit(run_one, plan)) for plan in plans]
+        for plan, future in futures:
+            try:
+                generated.append(future.result())
+            except Exception as exc:
+                print(f"ERROR: {plan.target_date}: {exc}", file=sys.stderr)
+                failed.append(plan.target_date.isoformat())
+
+    print(f"\n{'='*60}")
+    print(f"Generated: {len(generated)}/{len(plans)} posts")
+    if failed:
+        print(f"Failed: {len(failed)} days")
+        for day_str in failed:
+            print(f"  - {day_str}")
+    print(f"{'='*60}")
+    if failed:
+        sys.exit(1)
 
 
 def main() -> None:
@@ -489,6 +1019,22 @@ def main() -> None:
         description="Generate daily blog post and thumbnail from topics JSON."
     )
     parser.add_argument("--date", help="ISO date (YYYY-MM-DD). Defaults to today.")
+    parser.add_argument(
+        "--from",
+        dest="date_from",
+        help="Batch mode: first ISO date (YYYY-MM-DD) of a range to generate",
+    )
+    parser.add_argument(
+        "--to",
+        dest="date_to",
+        help="Batch mode: last ISO date (inclusive). Defaults to --from.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=BATCH_WORKERS,
+        help=f"Batch mode: days generated concurrently (default: {BATCH_WORKERS})",
+    )
     parser.add_argument(
         "--title",
         help="Manual mode title (optional - auto-generated from description if not provided)",
@@ -508,9 +1054,23 @@ def main() -> None:
         help="Custom image URL (will be downloaded and optimized)",
     )
     parser.add_argument("--resources", help="Comma-separated resource links")
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="Run metadata, image and body generation concurrently",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=PIPELINE_DEADLINE_SECONDS,
+        help=f"Seconds allowed for the whole pipeline (default: {PIPELINE_DEADLINE_SECONDS:.0f})",
+    )
     args = parser.parse_args()
 
     manual_mode = bool(args.title or args.description)
+    batch_mode = bool(args.date_from or args.date_to)
+    if batch_mode and (manual_mode or args.date):
+        raise SystemExit("--from/--to cannot be combined with --date or manual mode")
 
     if args.date:
         target_date = date.fromisoformat(args.date)
@@ -520,6 +1080,14 @@ def main() -> None:
     api_key = load_text_key()
     client = genai.Client(api_key=api_key)
 
+    if batch_mode:
+        start = date.fromisoformat(args.date_from or args.date_to)
+        end = date.fromisoformat(args.date_to) if args.date_to else start
+        run_batch(client, start, end, args.workers, args.parallel, args.deadline)
+        return
+
+    runner = StageRunner(args.deadline)
+
     if manual_mode:
         if not args.description:
             raise SystemExit("--description is required when using manual mode")
@@ -530,10 +1098,10 @@ def main() -> None:
         if args.title:
             title = str(args.title).strip()
             # If title is provided but we need other metadata (like meta description)
-            suggested = suggest_metadata(title, body_instructions)
+            suggested = runner.run("metadata", suggest_metadata, title, body_instructions)
         else:
             print("Auto-generating title and metadata from description...")
-            suggested = suggest_metadata("", body_instructions)
+            suggested = runner.run("metadata", suggest_metadata, "", body_instructions)
             title = suggested.get("title")
             if not title:
                 print("WARNING: AI failed to generate title, using fallback.")
@@ -555,71 +1123,26 @@ def main() -> None:
         # KEY FIX: Use suggested 'description' for front matter, keep args.description for body generation
         meta_description = suggested.get("description") or f"A deep dive into {title}."
 
-        resources = parse_resources_csv(args.resources)
-        topic = {
-            "title": title,
-            "description_prompt": body_instructions,
-            "category": category,
-            "tags": tags,
-            "resources": resources,
-            "permalink": permalink,
-            "image_prompt": image_prompt_base,
-        }
+        plan = PostPlan(
+            target_date=target_date,
+            title=title,
+            permalink=permalink,
+            category=category,
+            tags=tags,
+            body_instructions=body_instructions,
+            image_prompt_base=image_prompt_base,
+            resources=parse_resources_csv(args.resources),
+            meta_description=meta_description,
+        )
     else:
         topics = read_topics(target_date.month, target_date.year)
-        topic = pick_topic(topics, target_date.day)
-
-        title = str(topic.get("title") or "Technical Insight").strip()
-        permalink = slugify(topic.get("permalink") or title)
-        category = str(topic.get("category") or "Tech").strip()
-        tags = [str(t).lower().strip() for t in topic.get("tags", []) if str(t).strip()]
-        if not tags:
-            tags = slugify(title).split("-")[:6]
-
-        # For automated topics, description_prompt is essentially the instructions
-        body_instructions = str(
-            topic.get("description_prompt") or "Concise overview."
-        ).strip()
+        plan = plan_from_topic(target_date, pick_topic(topics, target_date.day))
 
-        # Use the suggest_metadata function to get a clean description instead of the raw instruction prompt.
-        try:
-            suggested = suggest_metadata(title, body_instructions)
-            meta_description = suggested.get("description") or body_instructions[:180]
-        except Exception as e:
-            print(f"Failed to generate metadata for description: {e}")
-            meta_description = body_instructions[:180]
-
-        image_prompt_base = str(
-            topic.get("image_prompt") or f"Hero image for {title}"
-        ).strip()
-        resources = topic.get("resources") or []
-
-    image_prompt = f"{image_prompt_base}. 1280x720, Nano Banana style, cinematic lighting, detailed."
-
-    # Update topic with the correct instruction for the writer
-    topic["description_prompt"] = body_instructions
-
-    body_prompt = build_body_prompt(topic)
-    # Generate image using Pexels
-    image_bytes = request_image(image_prompt, title, args.image_url)
-    image_name = f"{permalink}.webp"
-    image_path = save_webp(image_bytes, ASSETS_DIR / image_name)
-
-    # Then generate the post body using the text key
-    body = request_markdown(client, body_prompt)
-
-    now = datetime.now().astimezone()
-    timestamp = now.strftime("%Y-%m-%d %H:%M:%S %z")
-
-    front_matter = build_front_matter(
-        title, permalink, category, tags, image_path, meta_description, timestamp
-    )
-
-    filename = f"{target_date.strftime('%Y-%m-%d')}-{permalink}.md"
-    destination = ensure_unique_path(POSTS_DIR / filename)
-    write_post(destination, front_matter, body, resources)
-    print(f"Generated post: {destination}")
-    print(f"Thumbnail: {image_path}")
+    plan.image_url = args.image_url
+    try:
+        generate_post(client, plan, runner, args.parallel)
+    finally:
+        runner.report()
 
 
 if __name__ == "__main__":
@@ -10,11 +10,12 @@ import re
 import sys
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Dict
 
-import yaml
 from google import genai
 
+from front_matter import split_front_matter, write_post
+
 DEFAULT_MODEL = os.environ.get("GEMINI_TEXT_MODEL", "gemini-2.5-pro")
 POSTS_DIR = Path(__file__).resolve().parent.parent / "_posts"
 
@@ -41,16 +42,6 @@ def ensure_unique_path(base_path: Path) -> Path:
     raise RuntimeError("Could not find a unique filename after 99 attempts.")
 
 
-def split_front_matter(markdown: str) -> Tuple[Dict[str, Any], str]:
-    if markdown.startswith("---"):
-        parts = markdown.split("---", 2)
-        if len(parts) >= 3:
-            front_matter = yaml.safe_load(parts[1]) or {}
-            body = parts[2].lstrip("\n")
-            return front_matter, body
-    return {}, markdown
-
-
 def build_prompt(topic: str, category: str, timestamp: str, context: str | None) -> str:
     context_block = f"\nContext to respect:\n{context}\n" if context else ""
     return (
@@ -102,12 +93,6 @@ def normalize_front_matter(raw_front_matter: Dict[str, Any], topic: str, categor
     return front_matter
 
 
-def write_post(path: Path, front_matter: Dict[str, Any], body: str) -> None:
-    yaml_block = yaml.safe_dump(front_matter, sort_keys=False, allow_unicode=False)
-    content = f"---\n{yaml_block}---\n\n{body.strip()}\n"
-    path.write_text(content, encoding="utf-8")
-
-
 def main() -> None:
     parser = argparse.ArgumentParser(description="Generate a Chirpy-compatible draft using Gemini.")
     parser.add_argument("--topic", required=True, help="Topic for the blog post")
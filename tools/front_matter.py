@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Front-matter codec shared by the post tools.
+
+Delimiters are matched the way Jekyll does: a line that is exactly `---`
+opens the block and the next `---` (or `...`) line closes it, so `---`
+inside a YAML value never splits the header.
+
+YAML goes through libyaml (CSafeLoader/CSafeDumper) when PyYAML was built
+with it and falls back to the pure-Python classes otherwise. Run this file
+with --benchmark to compare both paths on the _posts corpus.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+import yaml
+
+POSTS_DIR = Path(__file__).resolve().parent.parent / "_posts"
+DELIMITER = b"---"
+CLOSERS = (b"---", b"...")
+# A top-level mapping key at column 0; block sequence items ("- x") belong to the key above.
+TOP_LEVEL_KEY = re.compile(rb"^([A-Za-z0-9_][\w.\- ]*?)\s*:(?:\s|$)")
+
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+LIBYAML = SafeLoader is not yaml.SafeLoader
+
+
+def load_yaml(text: str, loader: Any = None) -> Any:
+    return yaml.load(text, Loader=loader or SafeLoader)
+
+
+def dump_yaml(data: Any, dumper: Any = None) -> str:
+    return yaml.dump(data, Dumper=dumper or SafeDumper, sort_keys=False, allow_unicode=False)
+
+
+def _is_line(line: bytes, markers: Tuple[bytes, ...]) -> bool:
+    return line.rstrip(b" \t\r\n") in markers
+
+
+def read_header(path: Path) -> Tuple[str | None, int]:
+    """Return the raw YAML header text and body byte offset, reading no further.
+
+    A file without a complete header yields (None, 0).
+    """
+    with path.open("rb") as handle:
+        first = handle.readline()
+        if not _is_line(first, (DELIMITER,)):
+            return None, 0
+        lines = []
+        for line in handle:
+            if _is_line(line, CLOSERS):
+                return b"".join(lines).decode("utf-8"), handle.tell()
+            lines.append(line)
+    return None, 0
+
+
+def read_front_matter(path: Path) -> Tuple[Dict[str, Any], int]:
+    """Parse only the header of path, returning (front matter, body byte offset).
+
+    The file is read line by line and reading stops at the closing delimiter,
+    so the body is never loaded.
+    """
+    header, offset = read_header(path)
+    if header is None:
+        return {}, 0
+    return load_yaml(header) or {}, offset
+
+
+def read_front_matter_many(
+    paths: Iterable[Path], loader: Any = None
+) -> Tuple[Dict[Path, Tuple[Dict[str, Any], int]], Dict[Path, Exception]]:
+    """Batch form of read_front_matter, returning (parsed, errors) keyed by path.
+
+    All headers are parsed as one multi-document YAML stream, which avoids
+    per-call loader setup. If that stream fails to parse, the batch falls back
+    to file-by-file parsing so one malformed post only lands in errors.
+    """
+    parsed: Dict[Path, Tuple[Dict[str, Any], int]] = {}
+    errors: Dict[Path, Exception] = {}
+    present: List[Tuple[Path, str, int]] = []
+    for path in paths:
+        try:
+            header, offset = read_header(path)
+        except (OSError, UnicodeDecodeError) as exc:
+            errors[path] = exc
+            continue
+        if header is None:
+            parsed[path] = ({}, 0)
+        else:
+            present.append((path, header, offset))
+
+    stream = "".join(f"---\n{header}\n" for _, header, _ in present)
+    try:
+        documents = list(yaml.load_all(stream, Loader=loader or SafeLoader))
+    except yaml.YAMLError:
+        documents = []
+    if len(documents) == len(present):
+        for (path, _, offset), document in zip(present, documents):
+            parsed[path] = (document or {}, offset)
+        return parsed, errors
+
+    for path, header, offset in present:
+        try:
+            parsed[path] = (load_yaml(header, loader) or {}, offset)
+        except yaml.YAMLError as exc:
+            errors[path] = exc
+    return parsed, errors
+
+
+def read_body(path: Path, offset: int) -> str:
+    with path.open("rb") as handle:
+        handle.seek(offset)
+        return handle.read().decode("utf-8").lstrip("\n")
+
+
+def split_front_matter(markdown: str) -> Tuple[Dict[str, Any], str]:
+    """In-memory counterpart of read_front_matter for text that is already loaded."""
+    lines = markdown.splitlines(keepends=True)
+    if lines and _is_line(lines[0].encode("utf-8"), (DELIMITER,)):
+        for index in range(1, len(lines)):
+            if _is_line(lines[index].encode("utf-8"), CLOSERS):
+                header = "".join(lines[1:index])
+                body = "".join(lines[index + 1 :])
+                return load_yaml(header) or {}, body.lstrip("\n")
+    return {}, markdown
+
+
+def render_post(front_matter: Dict[str, Any], body: str) -> str:
+    return f"---\n{dump_yaml(front_matter)}---\n\n{body.strip()}\n"
+
+
+def write_post(path: Path, front_matter: Dict[str, Any], body: str) -> None:
+    path.write_text(render_post(front_matter, body), encoding="utf-8")
+
+
+def _key_span(header: List[bytes], key: str) -> Tuple[int, int] | None:
+    """Return the [start, end) line range of a top-level key's entry in header."""
+    for start, line in enumerate(header):
+        match = TOP_LEVEL_KEY.match(line)
+        if not match or match.group(1).decode("utf-8") != key:
+            continue
+        end = start + 1
+        while end < len(header) and not TOP_LEVEL_KEY.match(header[end]):
+            end += 1
+        # Blank lines and comments before the next key stay with the next key.
+        while end - 1 > start and (not header[end - 1].strip() or header[end - 1].lstrip().startswith(b"#")):
+            end -= 1
+        return start, end
+    return None
+
+
+def patch_front_matter(path: Path, updates: Dict[str, Any]) -> bool:
+    """Set top-level keys in path's header without re-serializing the rest.
+
+    Only keys whose parsed value differs are rewritten; every other header
+    line and the body bytes are copied through unchanged, and a file with
+    nothing to change is not written at all. If the patched header does not
+    parse back to the expected values (an unusual layout), the header alone
+    is re-rendered. Returns True when the file was written.
+    """
+    lines = path.read_bytes().splitlines(keepends=True)
+    if not lines or not _is_line(lines[0], (DELIMITER,)):
+        raise ValueError(f"No front matter in {path}")
+    close = next((index for index in range(1, len(lines)) if _is_line(lines[index], CLOSERS)), None)
+    if close is None:
+        raise ValueError(f"Unterminated front matter in {path}")
+
+    header = lines[1:close]
+    current = load_yaml(b"".join(header).decode("utf-8")) or {}
+    changes = {key: value for key, value in updates.items() if key not in current or current[key] != value}
+    if not changes:
+        return False
+
+    newline = b"\r\n" if lines[0].endswith(b"\r\n") else b"\n"
+    for key, value in changes.items():
+        block = dump_yaml({key: value}).encode("utf-8").replace(b"\n", newline)
+        span = _key_span(header, key)
+        if span is None:
+            header.append(block)
+        else:
+            header[span[0] : span[1]] = [block]
+
+    patched = b"".join(header)
+    expected = {**current, **changes}
+    if load_yaml(patched.decode("utf-8")) != expected:
+        patched = dump_yaml(expected).encode("utf-8").replace(b"\n", newline)
+
+    tmp_path = path.with_suffix(f"{path.suffix}.tmp")
+    tmp_path.write_bytes(lines[0] + patched + b"".join(lines[close:]))
+    os.replace(tmp_path, path)
+    return True
+
+
+def benchmark(posts_dir: Path = POSTS_DIR, rounds: int = 5) -> None:
+    paths = sorted(posts_dir.glob("*.md"))
+    headers = [read_header(path)[0] or "" for path in paths]
+    codecs = [("pure-python", yaml.SafeLoader, yaml.SafeDumper)]
+    if LIBYAML:
+        codecs.append(("libyaml", yaml.CSafeLoader, yaml.CSafeDumper))
+    else:
+        print("libyaml is not available in this PyYAML build; only the pure-Python path runs.")
+
+    print(f"{len(paths)} posts, best of {rounds} rounds")
+    for name, loader, dumper in codecs:
+        def best(func: Any) -> float:
+            timings = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            return min(timings)
+
+        parsed = [yaml.load(header, Loader=loader) or {} for header in headers]
+        load = best(lambda: [yaml.load(header, Loader=loader) for header in headers])
+        batch = best(lambda: read_front_matter_many(paths, loader))
+        dump = best(lambda: [dump_yaml(data, dumper) for data in parsed])
+        print(f"  {name:<12} load {load * 1000:7.1f} ms  batch read {batch * 1000:7.1f} ms  dump {dump * 1000:7.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Front-matter codec utilities.")
+    parser.add_argument("--benchmark", action="store_true", help="Compare libyaml and pure-Python YAML on _posts")
+    parser.add_argument("--rounds", type=int, default=5, help="Benchmark rounds (default: 5)")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(rounds=args.rounds)
+    else:
+        print(f"libyaml available: {LIBYAML}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:  # pragma: no cover
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Response cache for Gemini text calls, keyed by model, prompt hash and MIME type.
+
+Backends: a single SQLite file (default) or a directory of JSON files.
+Set GENAI_CACHE_BYPASS=1 to always call the model, and run this file
+directly to inspect or purge the cache.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Protocol
+
+CACHE_ROOT = Path(
+    os.environ.get(
+        "GENAI_CACHE_DIR",
+        Path(__file__).resolve().parent.parent / ".cache" / "genai",
+    )
+)
+CACHE_BACKEND = os.environ.get("GENAI_CACHE_BACKEND", "sqlite")
+CACHE_TTL_SECONDS = int(os.environ.get("GENAI_CACHE_TTL_HOURS", "72")) * 3600
+CACHE_BYPASS = os.environ.get("GENAI_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+def cache_key(model: str, prompt: str, mime_type: str) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model}\n{mime_type}\n{prompt_hash}".encode("utf-8")).hexdigest()
+
+
+class Store(Protocol):
+    def get(self, key: str) -> Dict[str, Any] | None: ...
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def entries(self) -> Iterator[Dict[str, Any]]: ...
+
+
+class SqliteStore:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, mime_type TEXT, "
+                "created REAL, prompt_preview TEXT, text TEXT)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT * FROM responses WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    entry["model"],
+                    entry["mime_type"],
+                    entry["created"],
+                    entry["prompt_preview"],
+                    entry["text"],
+                ),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT * FROM responses ORDER BY created").fetchall()
+        for row in rows:
+            yield dict(row)
+
+
+class DirectoryStore:
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        try:
+            return json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path(key).with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps({"key": key, **entry}), encoding="utf-8")
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        for path in sorted(self.root.glob("*.json")):
+            try:
+                yield json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+
+
+def open_store(backend: str = CACHE_BACKEND, root: Path = CACHE_ROOT) -> Store:
+    if backend == "sqlite":
+        return SqliteStore(root / "responses.sqlite3")
+    if backend == "dir":
+        return DirectoryStore(root / "responses")
+    raise ValueError(f"Unknown GENAI_CACHE_BACKEND: {backend}")
+
+
+_store: Store | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> Store:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = open_store()
+        return _store
+
+
+def response_text(response: Any) -> str | None:
+    raw = getattr(response, "text", None)
+    if not raw and getattr(response, "candidates", None):
+        parts = (
+            getattr(response.candidates[0].content, "parts", [])
+            if response.candidates[0].content
+            else []
+        )
+        if parts and getattr(parts[0], "text", None):
+            raw = parts[0].text
+    return str(raw) if raw else None
+
+
+def cached_text(model: str, prompt: str, mime_type: str) -> str | None:
+    """Return a fresh cached response without calling the model, or None."""
+    if CACHE_BYPASS:
+        return None
+    entry = get_store().get(cache_key(model, prompt, mime_type))
+    if entry and time.time() - entry["created"] < CACHE_TTL_SECONDS:
+        print(f"Using cached response from '{model}'.")
+        return entry["text"]
+    return None
+
+
+def generate_text(
+    client: Any,
+    model: str,
+    prompt: str,
+    mime_type: str,
+    limiter: Any = None,
+    bypass: bool = CACHE_BYPASS,
+    timeout: float | None = None,
+) -> str | None:
+    """Return the model's text for prompt, from the cache when a fresh entry exists.
+
+    Only usable responses are stored: empty text never is, and JSON responses
+    must parse, so a retry after a bad answer still reaches the model. A
+    timeout (seconds) bounds the model call itself.
+    """
+    if not bypass:
+        cached = cached_text(model, prompt, mime_type)
+        if cached is not None:
+            return cached
+
+    if limiter is not None:
+        limiter.acquire()
+    config: Dict[str, Any] = {"response_mime_type": mime_type}
+    if timeout is not None:
+        config["http_options"] = {"timeout": max(1000, int(timeout * 1000))}
+    response = client.models.generate_content(
+        model=model,
+        contents=prompt,
+        config=config,
+    )
+    text = response_text(response)
+    if not text:
+        return None
+    if mime_type == "application/json":
+        try:
+            json.loads(text)
+        except ValueError:
+            return text
+    get_store().put(
+        cache_key(model, prompt, mime_type),
+        {
+            "model": model,
+            "mime_type": mime_type,
+            "created": time.time(),
+            "prompt_preview": " ".join(prompt.split())[:120],
+            "text": text,
+        },
+    )
+    return text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or purge the Gemini response cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List cached responses")
+    show = sub.add_parser("show", help="Print one cached response")
+    show.add_argument("key", help="Cache key (or unique prefix)")
+    purge = sub.add_parser("purge", help="Delete cached responses")
+    purge.add_argument("--expired", action="store_true", help="Only delete entries past the TTL")
+    args = parser.parse_args()
+
+    store = get_store()
+    now = time.time()
+    if args.command == "list":
+        count = 0
+        for entry in store.entries():
+            age_h = (now - entry["created"]) / 3600
+            state = "expired" if now - entry["created"] >= CACHE_TTL_SECONDS else "fresh"
+            print(
+                f"{entry['key'][:12]}  {entry['model']:<20} {entry['mime_type']:<17} "
+                f"{age_h:6.1f}h {state:<7} {len(entry['text']):>6}ch  {entry['prompt_preview']}"
+            )
+            count += 1
+        print(f"{count} cached response(s) in {CACHE_BACKEND} store at {CACHE_ROOT}")
+    elif args.command == "show":
+        matches = [entry for entry in store.entries() if entry["key"].startswith(args.key)]
+        if len(matches) != 1:
+            raise SystemExit(f"{len(matches)} entries match '{args.key}'")
+        print(matches[0]["text"])
+    elif args.command == "purge":
+        removed = 0
+        for entry in list(store.entries()):
+            if args.expired and now - entry["created"] < CACHE_TTL_SECONDS:
+                continue
+            store.delete(entry["key"])
+            removed += 1
+        print(f"Removed {removed} cached response(s).")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:  # pragma: no cover
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,145 @@
+"""
+Shared pooled HTTP client: keep-alive sessions, capped streaming downloads and
+bounded concurrent prefetch.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from stage_runner import capped_timeout, in_current_stage
+
+MAX_WORKERS = int(os.environ.get("HTTP_MAX_WORKERS", "4"))
+MAX_DOWNLOAD_BYTES = int(os.environ.get("HTTP_MAX_DOWNLOAD_MB", "25")) * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Per-request timeout; inside a pipeline stage it shrinks to the time left
+TIMEOUT_SECONDS = float(os.environ.get("HTTP_TIMEOUT_SECONDS", "20"))
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session so repeated downloads reuse connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def fetch(
+    url: str,
+    headers: Dict[str, str] | None = None,
+    timeout: float | None = None,
+    max_bytes: int = MAX_DOWNLOAD_BYTES,
+) -> Tuple[int, bytes, Mapping[str, str]]:
+    """Stream url into memory, refusing bodies larger than max_bytes.
+
+    Returns (status, body, headers); a 304 comes back with an empty body.
+    Without an explicit timeout the stage deadline bounds the request.
+    """
+    if timeout is None:
+        timeout = capped_timeout(TIMEOUT_SECONDS)
+    with get_session().get(url, headers=headers or {}, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        declared = resp.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ValueError(f"Response is {int(declared)} bytes; limit is {max_bytes}")
+        buffer = bytearray()
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            buffer.extend(chunk)
+            if len(buffer) > max_bytes:
+                raise ValueError(f"Response exceeded {max_bytes} bytes")
+        return resp.status_code, bytes(buffer), resp.headers
+
+
+def fetch_bytes(
+    url: str,
+    headers: Dict[str, str] | None = None,
+    timeout: float | None = None,
+    max_bytes: int = MAX_DOWNLOAD_BYTES,
+) -> bytes:
+    return fetch(url, headers=headers, timeout=timeout, max_bytes=max_bytes)[1]
+
+
+class Prefetcher:
+    """Download URLs on a bounded thread pool while the caller processes earlier ones.
+
+    At most `window` downloads (max_workers by default) run or wait unread at
+    a time; later URLs queue in submission order. A body is released once
+    result() has returned it, so memory is bounded by the window rather than
+    by the number of URLs. Downloads run under the stage that created the
+    prefetcher, so they stop at its deadline.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, window: int | None = None, **fetch_kwargs: object) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+        self._window = max(1, window or max_workers)
+        self._fetch = in_current_stage(fetch_bytes)
+        self._fetch_kwargs = fetch_kwargs
+        self._futures: Dict[str, Future[bytes]] = {}
+        self._queued: Dict[str, None] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, url: str) -> Future[bytes]:
+        self._queued.pop(url, None)
+        future = self._futures[url] = self._pool.submit(self._fetch, url, **self._fetch_kwargs)
+        return future
+
+    def _fill(self) -> None:
+        while self._queued and len(self._futures) < self._window:
+            self._start(next(iter(self._queued)))
+
+    def submit(self, urls: Iterable[str]) -> None:
+        with self._lock:
+            for url in urls:
+                if url not in self._futures:
+                    self._queued.setdefault(url, None)
+            self._fill()
+
+    def submitted(self, url: str) -> bool:
+        """True while url is queued, downloading or downloaded but not yet read."""
+        with self._lock:
+            return url in self._futures or url in self._queued
+
+    def succeeded(self) -> List[str]:
+        """Unread URLs that have finished downloading without error, in submission order."""
+        with self._lock:
+            futures = list(self._futures.items())
+        return [
+            url
+            for url, future in futures
+            if future.done() and not future.cancelled() and future.exception() is None
+        ]
+
+    def result(self, url: str) -> bytes:
+        """Block until url has downloaded, starting it now if needed, and release it."""
+        with self._lock:
+            future = self._futures.get(url) or self._start(url)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                if self._futures.get(url) is future:
+                    del self._futures[url]
+                self._fill()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self) -> "Prefetcher":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
@@ -0,0 +1,205 @@
+"""
+Content-addressed on-disk cache of final encoded images.
+
+Three layers share one size-bounded LRU store:
+  * source URL -> content hash, revalidated with ETag/Last-Modified,
+  * content hash + encode parameters -> final encoded bytes,
+  * request key (e.g. prompt and title) -> final encoded bytes.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from http_client import fetch
+
+CACHE_DIR = Path(
+    os.environ.get(
+        "IMAGE_CACHE_DIR",
+        Path(__file__).resolve().parent.parent / ".cache" / "images",
+    )
+)
+CACHE_MAX_MB = int(os.environ.get("IMAGE_CACHE_MAX_MB", "200"))
+# Stock photo URLs are effectively immutable; only revalidate after this long.
+CACHE_REVALIDATE_SECONDS = int(os.environ.get("IMAGE_CACHE_REVALIDATE_HOURS", "168")) * 3600
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def params_key(content_hash: str, params: Dict[str, Any]) -> str:
+    """Key for an encode of content_hash under params (dimensions, budget, codec)."""
+    encoded = json.dumps(params, sort_keys=True)
+    return sha256_hex(f"{content_hash}:{encoded}".encode("utf-8"))
+
+
+class ImageCache:
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_MB * 1024 * 1024) -> None:
+        self.root = root
+        self.blobs_dir = root / "blobs"
+        self.index_path = root / "index.json"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        empty: Dict[str, Dict[str, Any]] = {"urls": {}, "requests": {}, "blobs": {}}
+        if not self.index_path.exists():
+            return empty
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return empty
+        for section in empty:
+            data.setdefault(section, {})
+        return data
+
+    def _save_index(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self._index, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.index_path)
+
+    def _read_blob(self, key: str) -> bytes | None:
+        entry = self._index["blobs"].get(key)
+        if entry is None:
+            return None
+        path = self.blobs_dir / key
+        try:
+            data = path.read_bytes()
+        except OSError:
+            del self._index["blobs"][key]
+            return None
+        entry["atime"] = time.time()
+        return data
+
+    def _write_blob(self, key: str, data: bytes) -> None:
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.blobs_dir / f"{key}.tmp"
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self.blobs_dir / key)
+        self._index["blobs"][key] = {"size": len(data), "atime": time.time()}
+        self._evict()
+
+    def _evict(self) -> None:
+        blobs = self._index["blobs"]
+        total = sum(entry["size"] for entry in blobs.values())
+        for key, entry in sorted(blobs.items(), key=lambda item: item[1]["atime"]):
+            if total <= self.max_bytes:
+                break
+            (self.blobs_dir / key).unlink(missing_ok=True)
+            total -= entry["size"]
+            del blobs[key]
+        live = set(blobs)
+        self._index["requests"] = {
+            name: key for name, key in self._index["requests"].items() if key in live
+        }
+
+    def get_encoded(self, content_hash: str, params: Dict[str, Any]) -> bytes | None:
+        with self._lock:
+            data = self._read_blob(params_key(content_hash, params))
+            if data is not None:
+                self._save_index()
+            return data
+
+    def put_encoded(self, content_hash: str, params: Dict[str, Any], data: bytes) -> str:
+        key = params_key(content_hash, params)
+        with self._lock:
+            self._write_blob(key, data)
+            self._save_index()
+        return key
+
+    def get_request(self, request_key: str) -> bytes | None:
+        """Return the final bytes previously stored for a whole image request."""
+        with self._lock:
+            key = self._index["requests"].get(request_key)
+            data = self._read_blob(key) if key else None
+            if data is not None:
+                self._save_index()
+            return data
+
+    def put_request(self, request_key: str, data: bytes) -> None:
+        key = sha256_hex(data)
+        with self._lock:
+            self._index["requests"][request_key] = key
+            if key not in self._index["blobs"]:
+                self._write_blob(key, data)
+            self._save_index()
+
+    def has_encoded(self, url: str, params: Dict[str, Any]) -> bool:
+        """True when encoded_from_url would be answered without a request."""
+        with self._lock:
+            known = self._index["urls"].get(url)
+            if not known or time.time() - known.get("checked", 0) >= CACHE_REVALIDATE_SECONDS:
+                return False
+            return params_key(known["content_hash"], params) in self._index["blobs"]
+
+    def encoded_from_download(
+        self, url: str, params: Dict[str, Any], encode: Callable[[bytes], bytes], data: bytes
+    ) -> bytes:
+        """Like encoded_from_url, for bytes the caller already downloaded from url."""
+        return self._store_download(url, params, encode, data, {})
+
+    def encoded_from_url(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        encode: Callable[[bytes], bytes],
+        headers: Dict[str, str] | None = None,
+    ) -> bytes:
+        """Return encode(download(url)), skipping the download and/or encode when cached."""
+        with self._lock:
+            known = dict(self._index["urls"].get(url) or {})
+
+        if known:
+            cached = self.get_encoded(known["content_hash"], params)
+            fresh = time.time() - known.get("checked", 0) < CACHE_REVALIDATE_SECONDS
+            if cached is not None and fresh:
+                return cached
+            validators = {}
+            if known.get("etag"):
+                validators["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                validators["If-Modified-Since"] = known["last_modified"]
+            if cached is not None and validators:
+                status, data, resp_headers = fetch(url, headers={**(headers or {}), **validators})
+                if status == 304:
+                    with self._lock:
+                        self._index["urls"][url]["checked"] = time.time()
+                        self._save_index()
+                    return cached
+                return self._store_download(url, params, encode, data, resp_headers)
+
+        _, data, resp_headers = fetch(url, headers=headers)
+        return self._store_download(url, params, encode, data, resp_headers)
+
+    def _store_download(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        encode: Callable[[bytes], bytes],
+        data: bytes,
+        resp_headers: Any,
+    ) -> bytes:
+        content_hash = sha256_hex(data)
+        with self._lock:
+            self._index["urls"][url] = {
+                "content_hash": content_hash,
+                "etag": resp_headers.get("ETag"),
+                "last_modified": resp_headers.get("Last-Modified"),
+                "checked": time.time(),
+            }
+            self._save_index()
+        # Same bytes behind a different URL still reuse the earlier encode.
+        cached = self.get_encoded(content_hash, params)
+        if cached is not None:
+            return cached
+        encoded = encode(data)
+        self.put_encoded(content_hash, params, encoded)
+        return encoded
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Shared image encoding helpers: WebP/AVIF output formats, named encode
+profiles, a bisecting quality solver, budget checks and a reduced-resolution
+decode for oversized sources.
+
+Run this file directly to benchmark each profile's encode cost and output
+size on sample images.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageChops, ImageStat
+
+try:
+    # Registers an AVIF plugin on Pillow builds without native support.
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Sources over either ceiling are rejected from their header, before any pixels are decoded.
+MAX_SOURCE_PIXELS = int(float(os.environ.get("IMAGE_MAX_SOURCE_MEGAPIXELS", "60")) * 1_000_000)
+MAX_SOURCE_BYTES = int(float(os.environ.get("IMAGE_MAX_SOURCE_MB", "40")) * 1024 * 1024)
+# Same idea as Image.thumbnail's reducing_gap: cheap reductions stop at twice
+# the target size so the final LANCZOS resize still has detail to work with.
+REDUCING_GAP = 2
+
+# libwebp "method" trades encode speed for compression. Method 2 is about 3x
+# faster than 6 and comes out a few percent larger (method 0 is 30-50% larger,
+# which skewed the bisection low); solve_quality rescales probe sizes by the
+# final/probe ratio it measures.
+PROBE_METHOD = 2
+FINAL_METHOD = 6
+MAX_FINAL_ENCODES = 3
+QUALITY_STEP = 5
+# Last final/probe size ratio seen per format, the starting guess for the next image
+_probe_ratios: Dict[str, float] = {}
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    name: str
+    pil_format: str
+    mime_type: str
+    # Encoder options for cheap size probes and for the encode that is kept
+    probe_options: Dict[str, Any] = field(default_factory=dict)
+    final_options: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def extension(self) -> str:
+        return f".{self.name}"
+
+
+FORMATS = {
+    "webp": OutputFormat("webp", "WEBP", "image/webp", {"method": PROBE_METHOD}, {"method": FINAL_METHOD}),
+    # libavif speed 8 probes are ~3x faster than speed 6 and a few percent larger.
+    "avif": OutputFormat("avif", "AVIF", "image/avif", {"speed": 8}, {"speed": 6}),
+}
+
+
+def available_formats() -> List[str]:
+    Image.init()
+    return [name for name, fmt in FORMATS.items() if fmt.pil_format in Image.SAVE]
+
+
+# Formats tried for post images, in preference order; unavailable ones are dropped.
+OUTPUT_FORMATS = [
+    name.strip()
+    for name in os.environ.get("IMAGE_OUTPUT_FORMATS", "webp,avif").split(",")
+    if name.strip() in available_formats()
+]
+
+
+@dataclass(frozen=True)
+class EncodeProfile:
+    """Where an image is shown decides its size, resampling, byte budget and format."""
+
+    name: str
+    max_dimensions: Tuple[int, int]
+    max_kb: int
+    min_quality: int = 30
+    max_quality: int = 80
+    resample: Image.Resampling = Image.Resampling.LANCZOS
+    fmt: str = "webp"
+
+    @property
+    def max_bytes(self) -> int:
+        return self.max_kb * 1024
+
+    def with_budget(self, max_kb: int) -> "EncodeProfile":
+        return replace(self, max_kb=max_kb)
+
+
+PROFILES = {
+    # Stock photos and placeholders picked for daily posts
+    "thumbnail": EncodeProfile("thumbnail", (1280, 720), int(os.environ.get("IMAGE_MAX_KB", "60"))),
+    # Generated post headers; Gemini's 16:9 output (1344x768) fits without a resize
+    "header": EncodeProfile(
+        "header", (1600, 900), int(os.environ.get("IMAGE_HEADER_MAX_KB", "150")), max_quality=85
+    ),
+    # Images converted by hand for post bodies: a 50KB target with 5KB of slack
+    "inline": EncodeProfile("inline", (1280, 720), int(os.environ.get("IMAGE_INLINE_MAX_KB", "55")), max_quality=85),
+}
+
+
+def is_webp(data: bytes) -> bool:
+    return len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WEBP"
+
+
+def webp_within_budget(
+    data: bytes, max_bytes: int, max_dimensions: Tuple[int, int] | None = None
+) -> bool:
+    """Return True when data is already a WebP that needs no re-encode."""
+    if not is_webp(data) or len(data) > max_bytes:
+        return False
+    if max_dimensions is None:
+        return True
+    try:
+        # Image.open only parses the header; no pixels are decoded here.
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+    except Exception:
+        return False
+    return width <= max_dimensions[0] and height <= max_dimensions[1]
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def check_source_size(size: int) -> None:
+    if size > MAX_SOURCE_BYTES:
+        raise ImageTooLarge(
+            f"Source is {size / 1024 / 1024:.1f}MB; the limit is {MAX_SOURCE_BYTES / 1024 / 1024:.0f}MB"
+            " (IMAGE_MAX_SOURCE_MB)"
+        )
+
+
+def _proc_status_mb(field: str) -> float | None:
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith(f"{field}:"):
+                    # Reported in kB
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_peak_rss() -> float | None:
+    """Reset the kernel's peak-RSS mark to the current RSS and return it in MB.
+
+    Linux only (None elsewhere). Pillow allocates pixel buffers outside the
+    Python allocator, so tracemalloc would not see them; ru_maxrss never
+    resets, so it reports the process's largest image ever, not this one.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return None
+    return _proc_status_mb("VmRSS")
+
+
+def decode_for_target(
+    data: bytes, max_dimensions: Tuple[int, int], report: bool = False
+) -> Image.Image:
+    """Decode data as RGB at no more than about twice max_dimensions.
+
+    JPEGs are decoded with draft mode (libjpeg's DCT scaling), so a
+    6000px original never exists in memory at full size; other formats are
+    shrunk with Image.reduce right after decoding. Callers still
+    thumbnail() to the exact size. Size ceilings are checked from the header
+    first.
+    """
+    check_source_size(len(data))
+    baseline = _reset_peak_rss() if report else None
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if width * height > MAX_SOURCE_PIXELS:
+        raise ImageTooLarge(
+            f"Source is {width}x{height}; the limit is {MAX_SOURCE_PIXELS / 1_000_000:.0f} megapixels"
+            " (IMAGE_MAX_SOURCE_MEGAPIXELS)"
+        )
+
+    scale = min(max_dimensions[0] / width, max_dimensions[1] / height)
+    if scale < 1:
+        wanted = (max(1, round(width * scale * REDUCING_GAP)), max(1, round(height * scale * REDUCING_GAP)))
+        if image.format == "JPEG":
+            image.draft("RGB", wanted)
+        image = image.convert("RGB")
+        factor = min(image.width // wanted[0], image.height // wanted[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+    else:
+        image = image.convert("RGB")
+
+    if report:
+        peak = _proc_status_mb("VmHWM") if baseline is not None else None
+        growth = peak - baseline if peak is not None and baseline is not None else None
+        buffer_mb = image.width * image.height * 3 / 1024 / 1024
+        full_mb = width * height * 3 / 1024 / 1024
+        print(
+            f"  Decoded {width}x{height} at {image.width}x{image.height} "
+            f"({buffer_mb:.1f}MB pixel buffer instead of {full_mb:.1f}MB"
+            f"{f', peak RSS +{growth:.0f}MB during decode' if growth is not None else ''})"
+        )
+    return image
+
+
+def encode_image(image: Image.Image, quality: int, fmt: str = "webp", final: bool = True) -> bytes:
+    output = FORMATS[fmt]
+    buffer = io.BytesIO()
+    options = output.final_options if final else output.probe_options
+    image.save(buffer, format=output.pil_format, quality=quality, **options)
+    return buffer.getvalue()
+
+
+def solve_quality(
+    image: Image.Image,
+    max_bytes: int,
+    min_quality: int = 30,
+    max_quality: int = 80,
+    fmt: str = "webp",
+) -> Tuple[bytes, int]:
+    """Encode at the highest quality that fits max_bytes.
+
+    Quality is bisected with cheap probe encodes, then a final encode is made
+    at the chosen quality. Probes come out larger than final encodes, so the
+    final/probe size ratio is measured and the bisection repeated with
+    corrected probe sizes, above the last fit and below the last miss, for
+    at most MAX_FINAL_ENCODES final encodes. If nothing fits, the
+    min_quality encode is returned so callers always get usable bytes.
+    """
+    probes: Dict[int, int] = {}
+
+    def probe(quality: int) -> int:
+        if quality not in probes:
+            probes[quality] = len(encode_image(image, quality, fmt, final=False))
+        return probes[quality]
+
+    # Qualities are searched on a QUALITY_STEP grid, with max_quality on it
+    grid = list(range(max_quality, min_quality - 1, -QUALITY_STEP))[::-1]
+    if grid[0] != min_quality:
+        grid.insert(0, min_quality)
+    best: Tuple[bytes, int] | None = None
+    low, high, ratio = 0, len(grid) - 1, _probe_ratios.get(fmt, 1.0)
+    for _ in range(MAX_FINAL_ENCODES):
+        index, top = low, high
+        # Generous budgets are common: check the top quality before bisecting
+        if probe(grid[top]) * ratio <= max_bytes:
+            index, low = top, top + 1
+        while low <= top:
+            mid = (low + top + 1) // 2
+            if probe(grid[mid]) * ratio <= max_bytes:
+                index, low = mid, mid + 1
+            else:
+                top = mid - 1
+        quality = grid[index]
+        data = encode_image(image, quality, fmt)
+        if len(data) <= max_bytes:
+            best = (data, quality)
+            low = index + 1
+        else:
+            high = index - 1
+            low = grid.index(best[1]) + 1 if best else 0
+        ratio = _probe_ratios[fmt] = len(data) / probe(quality)
+        if low > high:
+            break
+    if best is not None:
+        return best
+    if quality == min_quality:
+        return data, quality
+    return encode_image(image, min_quality, fmt), min_quality
+
+
+def solve_webp_quality(
+    image: Image.Image,
+    max_bytes: int,
+    min_quality: int = 30,
+    max_quality: int = 80,
+) -> Tuple[bytes, int]:
+    return solve_quality(image, max_bytes, min_quality, max_quality, "webp")
+
+
+def fit_to_profile(image: Image.Image, profile: EncodeProfile) -> Image.Image:
+    """Return an RGB copy of image scaled down (never up) to the profile's dimensions."""
+    fitted = image.convert("RGB") if image.mode != "RGB" else image.copy()
+    fitted.thumbnail(profile.max_dimensions, profile.resample)
+    return fitted
+
+
+def decode_for_profile(data: bytes, profile: EncodeProfile, report: bool = False) -> Image.Image:
+    return fit_to_profile(decode_for_target(data, profile.max_dimensions, report), profile)
+
+
+def encode_with_profile(image: Image.Image, profile: EncodeProfile, fmt: str | None = None) -> Tuple[bytes, int]:
+    """Fit image to profile and encode it at the highest quality within the profile's budget."""
+    return solve_quality(
+        fit_to_profile(image, profile), profile.max_bytes, profile.min_quality, profile.max_quality, fmt or profile.fmt
+    )
+
+
+def psnr(reference: Image.Image, data: bytes) -> float:
+    """Peak signal-to-noise ratio of encoded data against reference, in dB."""
+    with Image.open(io.BytesIO(data)) as decoded:
+        diff = ImageChops.difference(reference.convert("RGB"), decoded.convert("RGB"))
+    mse = sum(rms * rms for rms in ImageStat.Stat(diff).rms) / 3
+    return math.inf if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+
+@dataclass
+class Encoded:
+    fmt: str
+    data: bytes
+    quality: int
+    psnr: float
+
+
+def encode_best(
+    image: Image.Image,
+    max_bytes: int,
+    min_quality: int = 30,
+    max_quality: int = 80,
+    formats: List[str] | None = None,
+) -> List[Encoded]:
+    """Encode image in every output format and rank the results, best first.
+
+    Quality numbers mean different things per codec (AVIF q50 looks roughly
+    like WebP q80), so encodes that fit max_bytes are ranked by measured PSNR
+    against image; ties go to the smaller file.
+    """
+    results = []
+    for name in formats or OUTPUT_FORMATS:
+        data, quality = solve_quality(image, max_bytes, min_quality, max_quality, name)
+        results.append(Encoded(name, data, quality, psnr(image, data)))
+    return sorted(results, key=lambda item: (len(item.data) > max_bytes, -item.psnr, len(item.data)))
+
+
+def rank_with_profile(
+    image: Image.Image, profile: EncodeProfile, formats: List[str] | None = None
+) -> List[Encoded]:
+    """encode_best for an image fitted to profile, using its budget and quality range."""
+    return encode_best(
+        fit_to_profile(image, profile), profile.max_bytes, profile.min_quality, profile.max_quality, formats
+    )
+
+
+def match_psnr(
+    image: Image.Image, target_psnr: float, fmt: str, min_quality: int = 30, max_quality: int = 90
+) -> Tuple[bytes, int]:
+    """Encode at the lowest quality whose PSNR reaches target_psnr.
+
+    This is the "same quality, fewer bytes" counterpart of solve_quality for
+    images without a byte budget. Falls back to max_quality if the target is
+    never reached.
+    """
+    best = max_quality
+    low, high = min_quality, max_quality
+    while low <= high:
+        mid = (low + high) // 2
+        if psnr(image, encode_image(image, mid, fmt, final=False)) >= target_psnr:
+            best = mid
+            high = mid - 1
+        else:
+            low = mid + 1
+    return encode_image(image, best, fmt), best
+
+
+def encode_alternate(
+    image: Image.Image, webp_bytes: bytes, formats: List[str] | None = None
+) -> Tuple[str, bytes] | None:
+    """Return (format, bytes) for the smallest non-WebP encode that matches the WebP's PSNR.
+
+    image must be the source the WebP was encoded from. None when no
+    enabled format beats the WebP.
+    """
+    target = psnr(image, webp_bytes)
+    best: Tuple[str, bytes] | None = None
+    for name in formats or OUTPUT_FORMATS:
+        if name == "webp":
+            continue
+        data, _ = match_psnr(image, target, name)
+        if len(data) < len(best[1] if best else webp_bytes):
+            best = (name, data)
+    return best
+
+
+def benchmark(paths: List[str], profiles: List[str], formats: List[str]) -> None:
+    for path in paths:
+        data = Path(path).read_bytes()
+        print(f"{path} ({len(data) / 1024:.1f}KB)")
+        for name in profiles:
+            profile = PROFILES[name]
+            started = time.perf_counter()
+            image = decode_for_profile(data, profile)
+            decoded = time.perf_counter() - started
+            for fmt in formats:
+                started = time.perf_counter()
+                encoded, quality = encode_with_profile(image, profile, fmt)
+                elapsed = time.perf_counter() - started
+                print(
+                    f"  {name:<9} {fmt:<4} {image.width}x{image.height} "
+                    f"{len(encoded) / 1024:6.1f}KB/{profile.max_kb}KB q={quality:<2} "
+                    f"PSNR={psnr(image, encoded):.2f}dB decode={decoded * 1000:.0f}ms encode={elapsed * 1000:.0f}ms"
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark encode profiles on sample images.")
+    parser.add_argument("images", nargs="+", help="Image files to encode")
+    parser.add_argument(
+        "--profile", "-p", action="append", choices=sorted(PROFILES), help="Profile to run (default: all)"
+    )
+    parser.add_argument(
+        "--format", "-f", action="append", choices=sorted(FORMATS), help="Format to encode (default: IMAGE_OUTPUT_FORMATS)"
+    )
+    args = parser.parse_args()
+    formats = args.format or OUTPUT_FORMATS
+    missing = [fmt for fmt in formats if fmt not in available_formats()]
+    if missing:
+        raise RuntimeError(f"Not supported by this Pillow build: {', '.join(missing)}")
+    benchmark(args.images, args.profile or list(PROFILES), formats)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:  # pragma: no cover
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Perceptual-hash index of the images under assets/img, used to catch the same
+stock photo being stored again under a different slug.
+
+Each image gets a 64-bit average hash and difference hash; two images are
+near-duplicates when both hashes are within DUPLICATE_DISTANCE bits. The
+index is refreshed incrementally: only new or changed files are hashed, and
+a file whose content matches its record (as after a fresh checkout, which
+resets every mtime) is not decoded again.
+Run this file directly for a report of duplicate clusters and the posts
+that use them.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from front_matter import read_front_matter_many
+from image_metadata import resolve_image
+from post_index import POSTS_DIR
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+ASSETS_DIR = ROOT_DIR / "assets" / "img"
+INDEX_PATH = Path(
+    os.environ.get(
+        "IMAGE_HASH_INDEX_PATH",
+        ROOT_DIR / ".cache" / "image_hashes.json",
+    )
+)
+INDEX_VERSION = 1
+DUPLICATE_DISTANCE = int(os.environ.get("IMAGE_DUPLICATE_DISTANCE", "6"))
+HASHED_SUFFIXES = {".webp", ".png", ".jpg", ".jpeg", ".gif"}
+# Site chrome rather than post images
+SKIPPED_DIRS = {"favicons"}
+# srcset variants from image_variants; AVIF files are alternates of a WebP.
+VARIANT_NAME = re.compile(r"-\d+w$")
+
+
+def average_hash(gray: Image.Image) -> int:
+    pixels = list(gray.resize((8, 8), Image.Resampling.LANCZOS).tobytes())
+    mean = sum(pixels) / len(pixels)
+    return sum(1 << index for index, value in enumerate(pixels) if value > mean)
+
+
+def difference_hash(gray: Image.Image) -> int:
+    pixels = list(gray.resize((9, 8), Image.Resampling.LANCZOS).tobytes())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            if pixels[row * 9 + col] < pixels[row * 9 + col + 1]:
+                bits |= 1 << (row * 8 + col)
+    return bits
+
+
+def image_hashes(image: Image.Image) -> Tuple[int, int]:
+    """Return (aHash, dHash) for image."""
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    gray = image.convert("L")
+    return average_hash(gray), difference_hash(gray)
+
+
+def hash_bytes(data: bytes) -> Tuple[int, int]:
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (64, 64))
+        return image_hashes(image)
+
+
+def distance(left: Tuple[int, int], right: Tuple[int, int]) -> int:
+    """Bits that differ, taking the worse of the two hashes."""
+    return max((left[0] ^ right[0]).bit_count(), (left[1] ^ right[1]).bit_count())
+
+
+def is_hashed(path: Path) -> bool:
+    return (
+        path.suffix.lower() in HASHED_SUFFIXES
+        and not VARIANT_NAME.search(path.stem)
+        and not SKIPPED_DIRS.intersection(path.parts)
+    )
+
+
+class HashIndex:
+    def __init__(self, assets_dir: Path = ASSETS_DIR, path: Path = INDEX_PATH) -> None:
+        self.assets_dir = assets_dir
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION or data.get("assets_dir") != str(self.assets_dir):
+            return {}
+        return data.get("images", {})
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": INDEX_VERSION, "assets_dir": str(self.assets_dir), "images": self._records}
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(payload, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def refresh(self) -> "HashIndex":
+        """Hash new or changed images, drop deleted ones, and persist if anything changed."""
+        with self._lock:
+            seen = set()
+            changed = False
+            for path in self.assets_dir.rglob("*"):
+                if not is_hashed(path) or not path.is_file():
+                    continue
+                name = path.relative_to(self.assets_dir).as_posix()
+                seen.add(name)
+                stat = path.stat()
+                record = self._records.get(name)
+                if record and record["mtime"] == stat.st_mtime_ns and record["size"] == stat.st_size:
+                    continue
+                data = path.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                changed = True
+                if record and record.get("sha256") == digest:
+                    record.update({"mtime": stat.st_mtime_ns, "size": stat.st_size})
+                    continue
+                try:
+                    ahash, dhash = hash_bytes(data)
+                except Exception as exc:
+                    print(f"Could not hash {name}: {exc}")
+                    self._records.pop(name, None)
+                else:
+                    self._records[name] = {
+                        "ahash": f"{ahash:016x}",
+                        "dhash": f"{dhash:016x}",
+                        "mtime": stat.st_mtime_ns,
+                        "size": stat.st_size,
+                        "sha256": digest,
+                    }
+            for name in set(self._records) - seen:
+                del self._records[name]
+                changed = True
+            if changed:
+                self._save()
+        return self
+
+    def hashes(self) -> Dict[str, Tuple[int, int]]:
+        with self._lock:
+            return {
+                name: (int(record["ahash"], 16), int(record["dhash"], 16))
+                for name, record in sorted(self._records.items())
+            }
+
+    def similar(self, data: bytes, max_distance: int = DUPLICATE_DISTANCE) -> List[Tuple[str, int]]:
+        """Return (path relative to assets/img, distance) for stored near-duplicates, closest first."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            stored = next((record for record in self._records.values() if record.get("sha256") == digest), None)
+        wanted = (int(stored["ahash"], 16), int(stored["dhash"], 16)) if stored else hash_bytes(data)
+        matches = [(name, distance(wanted, stored)) for name, stored in self.hashes().items()]
+        return sorted(
+            ((name, bits) for name, bits in matches if bits <= max_distance), key=lambda item: (item[1], item[0])
+        )
+
+    def find_duplicate(self, data: bytes, max_distance: int = DUPLICATE_DISTANCE) -> str | None:
+        """Path (relative to assets/img) of the closest stored near-duplicate, or None."""
+        matches = self.refresh().similar(data, max_distance)
+        return matches[0][0] if matches else None
+
+    def clusters(self, max_distance: int = DUPLICATE_DISTANCE) -> List[List[str]]:
+        """Groups of two or more images linked by near-duplicate pairs."""
+        hashes = self.hashes()
+        names = list(hashes)
+        parent = {name: name for name in names}
+
+        def root(name: str) -> str:
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        for index, left in enumerate(names):
+            for right in names[index + 1 :]:
+                if distance(hashes[left], hashes[right]) <= max_distance:
+                    parent[root(right)] = root(left)
+
+        groups: Dict[str, List[str]] = {}
+        for name in names:
+            groups.setdefault(root(name), []).append(name)
+        return sorted((group for group in groups.values() if len(group) > 1), key=lambda group: group[0])
+
+
+def posts_by_image() -> Dict[Path, List[str]]:
+    """Map each image file referenced from front matter to the posts using it."""
+    parsed, _ = read_front_matter_many(sorted(POSTS_DIR.glob("*.md")))
+    usage: Dict[Path, List[str]] = {}
+    for path, (front_matter, _) in sorted(parsed.items()):
+        source = resolve_image(front_matter)
+        if source is not None:
+            usage.setdefault(source.resolve(), []).append(path.name)
+    return usage
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report near-duplicate images under assets/img.")
+    parser.add_argument(
+        "--distance",
+        type=int,
+        default=DUPLICATE_DISTANCE,
+        help=f"Maximum differing hash bits for a duplicate (default: {DUPLICATE_DISTANCE})",
+    )
+    args = parser.parse_args()
+
+    index = HashIndex().refresh()
+    clusters = index.clusters(args.distance)
+    usage = posts_by_image()
+    reclaimable = 0
+    for number, cluster in enumerate(clusters, start=1):
+        print(f"Cluster {number}:")
+        sizes = []
+        for name in cluster:
+            path = ASSETS_DIR / name
+            size = path.stat().st_size
+            sizes.append(size)
+            posts = usage.get(path.resolve(), [])
+            print(f"  {name} ({size / 1024:.1f}KB) <- {', '.join(posts) if posts else 'no posts'}")
+        reclaimable += sum(sizes) - max(sizes)
+    print(
+        f"{len(clusters)} duplicate cluster(s) across {len(index.hashes())} image(s); "
+        f"about {reclaimable / 1024:.0f}KB could be reclaimed."
+    )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:  # pragma: no cover
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
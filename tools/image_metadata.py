@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Placeholder metadata for post images: LQIP, width, height and dominant color.
+
+Chirpy shows `image.lqip` while the real image loads; width and height let
+the page reserve space for it. Run this file directly to backfill the
+metadata into the `image` front matter of every post, decoding each
+referenced image once across a process pool.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from PIL import Image, ImageFilter
+
+from front_matter import patch_front_matter, read_front_matter_many
+from post_index import POSTS_DIR, PostIndex, image_path_of
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+METADATA_KEYS = ("lqip", "width", "height", "color")
+
+
+def generate_lqip(image: Image.Image) -> str:
+    preview = image.copy()
+    preview.thumbnail((20, 20))
+    preview = preview.filter(ImageFilter.GaussianBlur(radius=1.5))
+    buffer = io.BytesIO()
+    preview.save(buffer, format="WEBP", quality=50)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def dominant_color(image: Image.Image) -> str:
+    """Most common colour of a small, palette-reduced copy, as #rrggbb."""
+    sample = image.copy()
+    sample.thumbnail((64, 64))
+    paletted = sample.quantize(colors=8)
+    count_index = max(paletted.getcolors() or [(1, 0)])
+    palette = paletted.getpalette() or [0, 0, 0]
+    red, green, blue = palette[count_index[1] * 3 : count_index[1] * 3 + 3]
+    return f"#{red:02x}{green:02x}{blue:02x}"
+
+
+def describe(image: Image.Image) -> Dict[str, Any]:
+    """Return the metadata stored alongside `image.path` in front matter."""
+    image = image.convert("RGB")
+    return {
+        "lqip": f"data:image/webp;base64,{generate_lqip(image)}",
+        "width": image.width,
+        "height": image.height,
+        "color": dominant_color(image),
+    }
+
+
+def describe_file(path: Path) -> Dict[str, Any]:
+    with Image.open(path) as image:
+        return describe(image)
+
+
+def resolve_image(front_matter: Dict[str, Any]) -> Path | None:
+    """Map a post's image to a file in the repo, or None for remote images."""
+    image = image_path_of(front_matter)
+    if not image or "://" in image:
+        return None
+    if not image.startswith("/"):
+        image = f"{str(front_matter.get('media_subpath') or '').rstrip('/')}/{image}"
+    return ROOT_DIR / image.lstrip("/")
+
+
+def with_metadata(value: Any, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge metadata into an `image` value, keeping path, alt and other keys."""
+    image = dict(value) if isinstance(value, dict) else {"path": value}
+    image.update(metadata)
+    return image
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill LQIP, dimensions and colour for post images.")
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="Recompute images that already have metadata")
+    args = parser.parse_args()
+
+    index = PostIndex(POSTS_DIR).refresh()
+    paths = [index.path_of(record) for record in index.all() if record["image"]]
+    parsed, errors = read_front_matter_many(paths)
+    for path, exc in errors.items():
+        print(f"Skipping {path.name}: {exc}")
+
+    targets: Dict[Path, Tuple[Dict[str, Any], Path]] = {}
+    for path, (front_matter, _) in parsed.items():
+        image = front_matter.get("image")
+        if not args.force and isinstance(image, dict) and all(image.get(key) for key in METADATA_KEYS):
+            continue
+        source = resolve_image(front_matter)
+        if source is None:
+            continue
+        if not source.is_file():
+            print(f"Skipping {path.name}: missing image {source.relative_to(ROOT_DIR)}")
+            continue
+        targets[path] = (front_matter, source)
+
+    # Posts can share an image; each file is decoded once.
+    sources = sorted({source for _, source in targets.values()})
+    metadata: Dict[Path, Dict[str, Any]] = {}
+    with ProcessPoolExecutor(max_workers=args.jobs or None) as pool:
+        futures = {source: pool.submit(describe_file, source) for source in sources}
+        for source, future in futures.items():
+            try:
+                metadata[source] = future.result()
+            except Exception as exc:  # pragma: no cover - log and continue
+                print(f"Could not decode {source.relative_to(ROOT_DIR)}: {exc}", file=sys.stderr)
+
+    updated = 0
+    for path, (front_matter, source) in sorted(targets.items()):
+        if source not in metadata:
+            continue
+        image = with_metadata(front_matter["image"], metadata[source])
+        if patch_front_matter(path, {"image": image}):
+            updated += 1
+    print(f"Decoded {len(sources)} image(s); updated {updated} post(s).")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:  # pragma: no cover
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Offline ranking of stock-photo candidates by their alt text.
+
+Candidates are scored by TF-IDF cosine similarity between their alt text and
+the post title plus search query, with IDF weights learnt from the titles,
+tags and categories of existing posts. Among equally similar candidates, the
+one whose alt text uses more of our tag vocabulary wins, standing in for the
+"tech-relevant" instruction the text model used to get; vocabulary alone
+never makes a candidate acceptable. Scoring six candidates takes
+microseconds, so the text model is only worth asking when the best score is
+low.
+
+Choices made by the text model are appended to LABELS_PATH. Run this file
+directly to measure how often the local ranker agrees with them and with the
+hand-labelled choices shipped in FIXTURE_PATH.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from post_index import PostIndex
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+LABELS_PATH = Path(
+    os.environ.get(
+        "IMAGE_RANK_LABELS_PATH",
+        ROOT_DIR / ".cache" / "image_choices.jsonl",
+    )
+)
+FIXTURE_PATH = Path(__file__).resolve().parent / "data" / "image_choices.jsonl"
+# Below this score the best candidate is a guess; callers may ask the text model.
+MIN_SCORE = float(os.environ.get("IMAGE_RANK_MIN_SCORE", "0.1"))
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "in", "into", "is", "it", "its",
+    "of", "on", "or", "the", "to", "with", "your", "you", "how", "what", "why", "vs",
+    "image", "photo", "picture", "illustration", "hero", "detailed", "cinematic", "lighting",
+    "style", "nano", "banana", "1280x720",
+}
+WORD = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+_lock = threading.Lock()
+_default: "AltTextRanker | None" = None
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words without stopwords, with a plural "s" stripped."""
+    tokens = []
+    for word in WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class AltTextRanker:
+    def __init__(self, documents: Iterable[List[str]], vocabulary: Set[str]) -> None:
+        document_frequency: Counter = Counter()
+        count = 0
+        for tokens in documents:
+            document_frequency.update(set(tokens))
+            count += 1
+        self.vocabulary = vocabulary
+        self._idf = {
+            term: math.log((count + 1) / (frequency + 1)) + 1 for term, frequency in document_frequency.items()
+        }
+        # Words no post uses are rare by definition
+        self._unseen_idf = math.log(count + 1) + 1
+
+    @classmethod
+    def from_posts(cls, index: PostIndex | None = None) -> "AltTextRanker":
+        records = (index or PostIndex()).refresh().all()
+        documents = [tokenize(" ".join([record["title"], *record["tags"], *record["categories"]])) for record in records]
+        vocabulary = {
+            token for record in records for token in tokenize(" ".join(record["tags"] + record["categories"]))
+        }
+        return cls(documents, vocabulary)
+
+    def vector(self, text: str) -> Dict[str, float]:
+        counts = Counter(tokenize(text))
+        weights = {term: count * self._idf.get(term, self._unseen_idf) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+    def score(self, alt: str, reference: Dict[str, float]) -> Tuple[float, float]:
+        """Return (cosine similarity, share of terms in the tag vocabulary)."""
+        candidate = self.vector(alt)
+        if not candidate:
+            return 0.0, 0.0
+        similarity = sum(weight * reference.get(term, 0.0) for term, weight in candidate.items())
+        known = sum(1 for term in candidate if term in self.vocabulary) / len(candidate)
+        return similarity, known
+
+    def rank(self, candidates: List[Dict[str, Any]], query: str, title: str) -> List[Tuple[float, int]]:
+        """Return (similarity, index) pairs, best first.
+
+        Equal similarities are broken by vocabulary share, then by the search
+        engine's order.
+        """
+        reference = self.vector(f"{title} {title} {query}")
+        scored = [
+            (*self.score(str(candidate.get("alt") or ""), reference), index) for index, candidate in enumerate(candidates)
+        ]
+        scored.sort(key=lambda item: (-item[0], -item[1], item[2]))
+        return [(similarity, index) for similarity, _, index in scored]
+
+    def suggest_query(self, title: str) -> str:
+        """A short query from the title's most distinctive words."""
+        terms = sorted(set(tokenize(title)), key=lambda term: (-self._idf.get(term, self._unseen_idf), term))
+        return " ".join(terms[:3] + ["technology"])
+
+
+def default_ranker() -> AltTextRanker:
+    global _default
+    with _lock:
+        if _default is None:
+            _default = AltTextRanker.from_posts()
+        return _default
+
+
+def rank_candidates(
+    candidates: List[Dict[str, Any]], query: str, title: str
+) -> Tuple[int | None, str | None, float]:
+    """Pick a candidate locally, returning (choice, new query, best score).
+
+    When no candidate shares a single word with the title or query, choice is
+    None and a new query built from the title is suggested instead.
+    """
+    if not candidates:
+        return None, None, 0.0
+    ranker = default_ranker()
+    score, index = ranker.rank(candidates, query, title)[0]
+    if score > 0:
+        return index, None, score
+    new_query = ranker.suggest_query(title)
+    return None, (new_query if new_query != query else None), 0.0
+
+
+def record_choice(candidates: List[Dict[str, Any]], query: str, title: str, choice: int | None) -> None:
+    """Append a text-model choice to the labelled set."""
+    entry = {
+        "title": title,
+        "query": query,
+        "alts": [str(candidate.get("alt") or "") for candidate in candidates],
+        "choice": choice,
+    }
+    with _lock:
+        LABELS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with LABELS_PATH.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(entry) + "\n")
+
+
+def load_labels(path: Path = LABELS_PATH) -> List[Dict[str, Any]]:
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
+        return []
+    labels = []
+    for line in lines:
+        try:
+            labels.append(json.loads(line))
+        except ValueError:
+            continue
+    return labels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure agreement between the local ranker and past text-model choices."
+    )
+    parser.add_argument(
+        "--labels",
+        type=Path,
+        action="append",
+        help=f"Labelled choices, repeatable (default: {FIXTURE_PATH} and {LABELS_PATH})",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Show every disagreement")
+    args = parser.parse_args()
+
+    paths = args.labels or [FIXTURE_PATH, LABELS_PATH]
+    labels = [label for path in paths for label in load_labels(path) if label.get("alts")]
+    if not labels:
+        print(f"No labelled choices in {', '.join(map(str, paths))}.")
+        return
+
+    default_ranker()
+    agree = confident = confident_agree = 0
+    started = time.perf_counter()
+    for label in labels:
+        candidates = [{"alt": alt} for alt in label["alts"]]
+        choice, _, score = rank_candidates(candidates, label["query"], label["title"])
+        matched = choice == label["choice"]
+        agree += matched
+        if score >= MIN_SCORE:
+            confident += 1
+            confident_agree += matched
+        if args.verbose and not matched:
+            print(f"{label['title']}: local={choice} ({score:.2f}) labelled={label['choice']}")
+    elapsed = time.perf_counter() - started
+
+    print(f"Agreement: {agree}/{len(labels)} ({agree / len(labels):.0%})")
+    if confident:
+        print(f"Above IMAGE_RANK_MIN_SCORE={MIN_SCORE}: {confident_agree}/{confident} ({confident_agree / confident:.0%})")
+    print(f"Ranking took {elapsed / len(labels) * 1e6:.0f}us per search (after a one-off model build).")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:  # pragma: no cover
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
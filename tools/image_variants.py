@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Responsive WebP variants for post images.
+
+Each source image is decoded once and re-encoded at the widths in
+VARIANT_WIDTHS, each with its own size budget. Variants sit next to the
+original as `<stem>-<width>w.webp`, and _data/image_variants.yml maps
+`image.path`, exactly as post front matter stores it, to a ready-made
+srcset of site-absolute paths:
+
+    {% assign variants = site.data.image_variants[page.image.path] %}
+
+_plugins/image-srcset-hook.rb adds that srcset to each post's preview
+image. Run this file directly to backfill variants for the images posts use.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from front_matter import dump_yaml, load_yaml, read_front_matter_many
+from image_codec import solve_webp_quality
+from image_metadata import resolve_image
+from post_index import POSTS_DIR, image_path_of
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+ASSETS_DIR = ROOT_DIR / "assets" / "img"
+MANIFEST_PATH = ROOT_DIR / "_data" / "image_variants.yml"
+# "width:budget_kb" pairs; the original image stays the largest candidate.
+VARIANT_WIDTHS: List[Tuple[int, int]] = [
+    (int(width), int(kb))
+    for width, kb in (
+        item.split(":") for item in os.environ.get("IMAGE_VARIANT_WIDTHS", "480:20,768:35").split(",") if item
+    )
+]
+VARIANT_NAME = re.compile(r"-\d+w$")
+
+_manifest_lock = threading.Lock()
+
+
+def variant_path(destination: Path, width: int) -> Path:
+    return destination.with_name(f"{destination.stem}-{width}w.webp")
+
+
+def web_path_of(path: Path) -> str:
+    return "/" + path.resolve().relative_to(ROOT_DIR).as_posix()
+
+
+def encode_variants(
+    image: Image.Image, widths: List[Tuple[int, int]] = VARIANT_WIDTHS
+) -> List[Tuple[int, bytes]]:
+    """Return (width, webp bytes) for every configured width narrower than image."""
+    image = image.convert("RGB")
+    variants = []
+    for width, budget_kb in sorted(widths, reverse=True):
+        if width >= image.width:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        data, _ = solve_webp_quality(resized, budget_kb * 1024, min_quality=30, max_quality=80)
+        variants.append((width, data))
+    return sorted(variants)
+
+
+def load_manifest() -> Dict[str, Any]:
+    try:
+        return load_yaml(MANIFEST_PATH.read_text(encoding="utf-8")) or {}
+    except FileNotFoundError:
+        return {}
+
+
+def record_variants(key: str, entry: Dict[str, Any] | None) -> None:
+    """Set (or with None, drop) the manifest entry for an `image.path` value."""
+    with _manifest_lock:
+        manifest = load_manifest()
+        if entry is None:
+            if manifest.pop(key, None) is None:
+                return
+        elif manifest.get(key) == entry:
+            return
+        else:
+            manifest[key] = entry
+        _save_manifest(manifest)
+
+
+def forget_variants(web_path: str) -> None:
+    """Drop every manifest entry whose full-size image is web_path."""
+    with _manifest_lock:
+        manifest = load_manifest()
+        kept = {key: entry for key, entry in manifest.items() if entry["variants"][-1]["path"] != web_path}
+        if len(kept) != len(manifest):
+            _save_manifest(kept)
+
+
+def alias_variants(web_path: str, key: str) -> None:
+    """Record web_path's existing entry under another `image.path` value too."""
+    with _manifest_lock:
+        manifest = load_manifest()
+        entry = next((entry for entry in manifest.values() if entry["variants"][-1]["path"] == web_path), None)
+        if entry is not None and manifest.get(key) != entry:
+            manifest[key] = entry
+            _save_manifest(manifest)
+
+
+def _save_manifest(manifest: Dict[str, Any]) -> None:
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    tmp_path.write_text(dump_yaml(dict(sorted(manifest.items()))), encoding="utf-8")
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def save_variants(
+    destination: Path,
+    web_path: str,
+    full_width: int,
+    variants: List[Tuple[int, bytes]],
+    keys: List[str] | None = None,
+) -> Dict[str, Any]:
+    """Write encoded variants next to destination and record them in the manifest.
+
+    keys are the `image.path` values posts use for this image (default:
+    web_path); the srcset itself always uses site-absolute paths.
+    """
+    entries = []
+    for width, data in variants:
+        path = variant_path(destination, width)
+        path.write_bytes(data)
+        entries.append({"width": width, "path": web_path.rsplit("/", 1)[0] + f"/{path.name}", "bytes": len(data)})
+    entries.append({"width": full_width, "path": web_path, "bytes": destination.stat().st_size})
+    entry = {
+        "srcset": ", ".join(f"{item['path']} {item['width']}w" for item in entries),
+        "variants": entries,
+    }
+    for key in keys or [web_path]:
+        record_variants(key, entry if variants else None)
+    return entry
+
+
+def generate_variants(
+    image: Image.Image, destination: Path, web_path: str, keys: List[str] | None = None
+) -> Dict[str, Any]:
+    return save_variants(destination, web_path, image.width, encode_variants(image), keys)
+
+
+def referenced_images() -> Dict[Path, List[str]]:
+    """Map each local post image to the `image.path` values that reference it."""
+    paths = sorted(path for path in POSTS_DIR.glob("*.md") if not path.name.startswith("."))
+    parsed, _ = read_front_matter_many(paths)
+    keys: Dict[Path, List[str]] = {}
+    for front_matter, _ in parsed.values():
+        source = resolve_image(front_matter)
+        key = image_path_of(front_matter)
+        if source is not None and key and key not in keys.setdefault(source.resolve(), []):
+            keys[source.resolve()].append(key)
+    return keys
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate responsive WebP variants for post images.")
+    parser.add_argument("paths", nargs="*", help="Images to process (default: every WebP a post uses)")
+    parser.add_argument("--force", action="store_true", help="Re-encode images that already have variants")
+    args = parser.parse_args()
+
+    references = referenced_images()
+    if args.paths:
+        sources = [Path(path).resolve() for path in args.paths]
+    else:
+        sources = sorted(path for path in references if path.suffix == ".webp" and path.is_file())
+        # Entries for paths no post uses any more are never looked up
+        stale = set(load_manifest()) - {key for keys in references.values() for key in keys}
+        for key in sorted(stale):
+            record_variants(key, None)
+    manifest = load_manifest()
+    created = 0
+    for source in sources:
+        keys = references.get(source)
+        if VARIANT_NAME.search(source.stem) or not keys:
+            continue
+        existing = [manifest.get(key) for key in keys]
+        if (
+            all(existing)
+            and not args.force
+            and all((ROOT_DIR / item["path"].lstrip("/")).exists() for entry in existing for item in entry["variants"])
+        ):
+            continue
+        with Image.open(io.BytesIO(source.read_bytes())) as image:
+            entry = generate_variants(image, source, web_path_of(source), keys)
+        sizes = ", ".join(f"{item['width']}w {item['bytes'] // 1024}KB" for item in entry["variants"])
+        print(f"{', '.join(keys)}: {sizes}")
+        created += 1
+    print(f"Generated variants for {created} image(s).")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:  # pragma: no cover
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
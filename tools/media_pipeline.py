@@ -5,30 +5,48 @@ Generate header images for posts missing image metadata.
 from __future__ import annotations
 
 import argparse
-import base64
-import io
 import os
 import re
 import sys
-from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, Iterable, Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 
-import yaml
 from google import genai
-from PIL import Image, ImageFilter
+
+from front_matter import patch_front_matter, read_body, read_front_matter
+from image_metadata import describe
+from image_codec import (
+    FORMATS,
+    PROFILES,
+    decode_for_profile,
+    encode_alternate,
+    encode_with_profile,
+)
+from image_variants import encode_variants, save_variants
+from post_index import PostIndex
 
 POSTS_DIR = Path(__file__).resolve().parent.parent / "_posts"
 HEADERS_DIR = Path(__file__).resolve().parent.parent / "assets" / "img" / "headers"
 DEFAULT_IMAGE_MODEL = os.environ.get("GEMINI_IMAGE_MODEL", "gemini-2.5-flash-image")
 DEFAULT_STYLE = "Nano Banana style, 3D isometric, clay material, high fidelity, cinematic lighting"
+HEADER = PROFILES["header"]
 
 
 @dataclass
 class Post:
     path: Path
     front_matter: Dict[str, Any]
-    body: str
+    body_offset: int = 0
+    _body: str | None = field(default=None, repr=False)
+
+    @property
+    def body(self) -> str:
+        """Post body, read from disk on first access only."""
+        if self._body is None:
+            self._body = read_body(self.path, self.body_offset)
+        return self._body
 
 
 def load_api_key() -> str:
@@ -43,18 +61,9 @@ def slugify(text: str) -> str:
     return cleaned or "post"
 
 
-def split_front_matter(markdown: str) -> Tuple[Dict[str, Any], str]:
-    if markdown.startswith("---"):
-        parts = markdown.split("---", 2)
-        if len(parts) >= 3:
-            return yaml.safe_load(parts[1]) or {}, parts[2].lstrip("\n")
-    return {}, markdown
-
-
 def parse_post(path: Path) -> Post:
-    raw = path.read_text(encoding="utf-8")
-    front_matter, body = split_front_matter(raw)
-    return Post(path=path, front_matter=front_matter, body=body)
+    front_matter, body_offset = read_front_matter(path)
+    return Post(path=path, front_matter=front_matter, body_offset=body_offset)
 
 
 def needs_image(front_matter: Dict[str, Any]) -> bool:
@@ -106,40 +115,51 @@ def request_image(client: genai.Client, prompt: str, model: str) -> bytes:
     return extract_image_bytes(response)
 
 
-def save_webp(image_bytes: bytes, destination: Path) -> Image.Image:
-    HEADERS_DIR.mkdir(parents=True, exist_ok=True)
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    destination.parent.mkdir(parents=True, exist_ok=True)
-    image.save(destination, format="WEBP", quality=85)
-    return image
+HeaderEncoding = Tuple[bytes, Dict[str, Any], List[Tuple[int, bytes]], Tuple[str, bytes] | None]
+
+
+def encode_header(image_bytes: bytes) -> HeaderEncoding:
+    """CPU half of header generation, returning bytes so a worker process can run it.
+
+    The image is fitted to the header profile and encoded within its budget.
+    Returns (webp bytes, image metadata, srcset variants, alternate format or None).
+    """
+    image = decode_for_profile(image_bytes, HEADER)
+    webp_bytes, _ = encode_with_profile(image, HEADER)
+    return webp_bytes, describe(image), encode_variants(image), encode_alternate(image, webp_bytes)
 
 
-def generate_lqip(image: Image.Image) -> str:
-    preview = image.copy()
-    preview.thumbnail((20, 20))
-    preview = preview.filter(ImageFilter.GaussianBlur(radius=1.5))
-    buffer = io.BytesIO()
-    preview.save(buffer, format="WEBP", quality=50)
-    return base64.b64encode(buffer.getvalue()).decode("ascii")
+def save_header(post: Post, header_path: Path, web_path: str, encoded: HeaderEncoding) -> None:
+    """Write an encoded header, its variants and alternate, then patch the post's `image`."""
+    webp_bytes, metadata, variants, alternate = encoded
+    header_path.parent.mkdir(parents=True, exist_ok=True)
+    header_path.write_bytes(webp_bytes)
+    save_variants(header_path, web_path, metadata["width"], variants)
+    if alternate is not None:
+        output = FORMATS[alternate[0]]
+        alternate_path = header_path.with_suffix(output.extension)
+        alternate_path.write_bytes(alternate[1])
+        metadata = {
+            **metadata,
+            "sources": [{"path": f"{web_path.rsplit('/', 1)[0]}/{alternate_path.name}", "type": output.mime_type}],
+        }
+    write_post(post, update_front_matter(post.front_matter, web_path, metadata))
 
 
-def update_front_matter(front_matter: Dict[str, Any], webp_path: str, lqip: str) -> Dict[str, Any]:
+def update_front_matter(front_matter: Dict[str, Any], webp_path: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
     updated = dict(front_matter)
-    updated["image"] = {"path": webp_path, "lqip": lqip}
+    updated["image"] = {"path": webp_path, **metadata}
     return updated
 
 
 def write_post(post: Post, front_matter: Dict[str, Any]) -> None:
-    yaml_block = yaml.safe_dump(front_matter, sort_keys=False, allow_unicode=False)
-    content = f"---\n{yaml_block}---\n\n{post.body.strip()}\n"
-    post.path.write_text(content, encoding="utf-8")
+    """Patch changed keys into the post's header; the rest of the file is left as is."""
+    if patch_front_matter(post.path, front_matter):
+        post.front_matter = dict(front_matter)
 
 
-def process_post(client: genai.Client, post: Post, style: str, model: str) -> None:
-    if not needs_image(post.front_matter):
-        print(f"Skipping (image exists): {post.path}")
-        return
-
+def header_target(post: Post, style: str) -> Tuple[Path, str, str]:
+    """Return (header file, web path, image prompt) for a post."""
     slug_source = post.front_matter.get("title") or post.path.stem
     slug = slugify(slug_source)
     header_path = HEADERS_DIR / f"{slug}.webp"
@@ -147,30 +167,95 @@ def process_post(client: genai.Client, post: Post, style: str, model: str) -> No
 
     summary = summarize_text(post.body)
     prompt = f"{style}. Create a header image for: {summary}"
-    image_bytes = request_image(client, prompt, model)
+    return header_path, web_path, prompt
+
 
-    final_image = save_webp(image_bytes, header_path)
-    lqip_value = generate_lqip(final_image)
+def process_post(client: genai.Client, post: Post, style: str, model: str) -> None:
+    if not needs_image(post.front_matter):
+        print(f"Skipping (image exists): {post.path}")
+        return
 
-    updated_front_matter = update_front_matter(post.front_matter, web_path, f"data:image/webp;base64,{lqip_value}")
-    write_post(post, updated_front_matter)
+    header_path, web_path, prompt = header_target(post, style)
+    image_bytes = request_image(client, prompt, model)
+
+    save_header(post, header_path, web_path, encode_header(image_bytes))
     print(f"Updated image for: {post.path}")
 
 
+def process_posts_concurrently(
+    client: genai.Client, posts: List[Post], style: str, model: str, concurrency: int
+) -> int:
+    """Generate headers with up to `concurrency` image requests in flight.
+
+    Encoding runs in a process pool; header and post writes stay on this
+    thread, one at a time. Returns the number of posts updated.
+    """
+    processed = 0
+    targets = {post.path: header_target(post, style) for post in posts}
+    with (
+        ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="image") as network_pool,
+        ProcessPoolExecutor() as cpu_pool,
+    ):
+        stage: Dict[Future[Any], Tuple[str, Post]] = {}
+        for post in posts:
+            future = network_pool.submit(request_image, client, targets[post.path][2], model)
+            stage[future] = ("request", post)
+        pending = set(stage)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, post = stage.pop(future)
+                try:
+                    if step == "request":
+                        encode_future = cpu_pool.submit(encode_header, future.result())
+                        stage[encode_future] = ("encode", post)
+                        pending.add(encode_future)
+                        continue
+                    header_path, web_path, _ = targets[post.path]
+                    save_header(post, header_path, web_path, future.result())
+                    print(f"Updated image for: {post.path}")
+                    processed += 1
+                except Exception as exc:  # pragma: no cover - log and continue
+                    print(f"Error processing {post.path}: {exc}", file=sys.stderr)
+    return processed
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Create Nano Banana style images for posts without images.")
     parser.add_argument("--limit", type=int, default=0, help="Maximum number of posts to process (0 = all)")
     parser.add_argument("--style", default=DEFAULT_STYLE, help="Style prompt prefix")
     parser.add_argument("--model", default=DEFAULT_IMAGE_MODEL, help="Gemini model for image generation")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Image generation requests in flight at once (default: 1 = sequential)",
+    )
     args = parser.parse_args()
 
     api_key = load_api_key()
     client = genai.Client(api_key=api_key)
 
+    # The index answers "has an image?" without re-reading every post
+    index = PostIndex(POSTS_DIR).refresh()
+
+    if args.concurrency > 1:
+        records = index.without_image()
+        if args.limit:
+            records = records[: args.limit]
+        posts = [parse_post(index.path_of(record)) for record in records]
+        processed = process_posts_concurrently(client, posts, args.style, args.model, args.concurrency)
+        print(f"Processed {processed} post(s).")
+        return
+
     processed = 0
-    for path in sorted(POSTS_DIR.glob("*.md")):
+    for record in index.all():
         if args.limit and processed >= args.limit:
             break
+        path = index.path_of(record)
+        if record["image"] is not None:
+            print(f"Skipping (image exists): {path}")
+            continue
         post = parse_post(path)
         try:
             process_post(client, post, args.style, args.model)
@@ -0,0 +1,129 @@
+"""
+Persistent per-model health record used to order Gemini fallback chains.
+
+Each model gets a small circuit breaker: after FAILURE_THRESHOLD consecutive
+failures it is skipped for a cooldown window that doubles with each further
+failure, then given one trial call. The default window outlasts the daily
+run, so a failing model is not retried first on the next day.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+HEALTH_PATH = Path(
+    os.environ.get(
+        "MODEL_HEALTH_PATH",
+        Path(__file__).resolve().parent.parent / ".cache" / "model_health.json",
+    )
+)
+FAILURE_THRESHOLD = int(os.environ.get("MODEL_FAILURE_THRESHOLD", "2"))
+COOLDOWN_SECONDS = int(os.environ.get("MODEL_COOLDOWN_HOURS", "26")) * 3600
+MAX_COOLDOWN_SECONDS = int(os.environ.get("MODEL_MAX_COOLDOWN_HOURS", "168")) * 3600
+# Permanent errors (unknown model, bad request) stay open for much longer.
+PERMANENT_COOLDOWN_SECONDS = int(os.environ.get("MODEL_PERMANENT_COOLDOWN_HOURS", "72")) * 3600
+
+_lock = threading.Lock()
+
+
+def failure_type(exc: BaseException) -> str:
+    """Classify an exception as timeout, rate_limit, permanent or transient."""
+    text = f"{type(exc).__name__} {exc}".lower()
+    if re.search(r"timeout|timed out|deadline", text):
+        return "timeout"
+    if re.search(r"\b429\b|resource_exhausted|quota", text):
+        return "rate_limit"
+    if re.search(r"\b40[04]\b|not_found|not found|invalid_argument", text):
+        return "permanent"
+    return "transient"
+
+
+def _load() -> Dict[str, Dict[str, Any]]:
+    try:
+        return json.loads(HEALTH_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(data: Dict[str, Dict[str, Any]]) -> None:
+    HEALTH_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = HEALTH_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp_path, HEALTH_PATH)
+
+
+def _is_open(record: Dict[str, Any], now: float) -> bool:
+    return record.get("open_until", 0) > now
+
+
+def _has_failed(record: Dict[str, Any]) -> bool:
+    return record.get("consecutive_failures", 0) > 0
+
+
+def cooldown_seconds(failures: int) -> float:
+    """Open-circuit window after the given number of consecutive failures."""
+    doublings = max(0, failures - FAILURE_THRESHOLD)
+    return min(MAX_COOLDOWN_SECONDS, COOLDOWN_SECONDS * 2 ** min(doublings, 16))
+
+
+def order_models(models: List[str]) -> List[str]:
+    """Return the fallback chain to try, based on recorded health.
+
+    Models with an open circuit are dropped, and models whose last call
+    failed move behind healthy ones until they record a success; otherwise
+    the preferred order is kept. If every circuit is open the full list is
+    returned so a run always has a model.
+    """
+    now = time.time()
+    with _lock:
+        data = _load()
+    available = [model for model in models if not _is_open(data.get(model, {}), now)]
+    skipped = [model for model in models if model not in available]
+    if skipped and available:
+        print(f"Skipping models in cooldown: {', '.join(skipped)}")
+    if not available:
+        return list(models)
+    return sorted(available, key=lambda model: _has_failed(data.get(model, {})))
+
+
+def record_success(model: str, latency: float) -> None:
+    with _lock:
+        data = _load()
+        record = data.setdefault(model, {})
+        record.update(
+            {
+                "consecutive_failures": 0,
+                "open_until": 0,
+                "last_success": time.time(),
+                "last_latency": round(latency, 3),
+            }
+        )
+        _save(data)
+
+
+def record_failure(model: str, exc: BaseException, latency: float) -> None:
+    kind = failure_type(exc)
+    now = time.time()
+    with _lock:
+        data = _load()
+        record = data.setdefault(model, {})
+        failures = int(record.get("consecutive_failures", 0)) + 1
+        record.update(
+            {
+                "consecutive_failures": failures,
+                "last_failure": now,
+                "last_failure_type": kind,
+                "last_error": str(exc)[:200],
+                "last_latency": round(latency, 3),
+            }
+        )
+        if kind == "permanent":
+            record["open_until"] = now + PERMANENT_COOLDOWN_SECONDS
+        elif failures >= FAILURE_THRESHOLD:
+            record["open_until"] = now + cooldown_seconds(failures)
+        _save(data)
@@ -11,6 +11,7 @@ import json
 import os
 import re
 import sys
+import time
 from dataclasses import dataclass
 from datetime import date
 from pathlib import Path
@@ -18,6 +19,9 @@ from typing import Any, List
 
 from google import genai
 
+from genai_cache import cached_text, generate_text
+from model_health import order_models, record_failure, record_success
+
 DEFAULT_MODEL = os.environ.get("GEMINI_TEXT_MODEL", "gemini-3.1-pro")
 FALLBACK_MODEL = os.environ.get("GEMINI_BLOG_MODEL_FALLBACK", "gemini-2.5-flash")
 TOPICS_DIR = Path(__file__).resolve().parent.parent / "topics"
@@ -87,18 +91,23 @@ def request_topics(client: genai.Client, prompt: str) -> list[Any]:
         "gemini-1.5-flash"
     ]
     
-    last_exc = None
+    # A retried run reuses whichever model answered last time
     for model_name in models_to_try:
+        cached = cached_text(model_name, prompt, "application/json")
+        if cached:
+            return json.loads(cached)
+
+    last_exc = None
+    for model_name in order_models(models_to_try):
+        started = time.monotonic()
         try:
-            response = client.models.generate_content(
-                model=model_name,
-                contents=prompt,
-                config={"response_mime_type": "application/json"},
-            )
-            raw = response.text if hasattr(response, "text") else None
+            raw = generate_text(client, model_name, prompt, "application/json", bypass=True)
             if raw:
-                return json.loads(raw)
+                topics = json.loads(raw)
+                record_success(model_name, time.monotonic() - started)
+                return topics
         except Exception as exc:
+            record_failure(model_name, exc, time.monotonic() - started)
             print(f"Model '{model_name}' failed: {exc}. Trying next...", file=sys.stderr)
             last_exc = exc
 
@@ -0,0 +1,239 @@
+"""
+Pexels search client with a persistent result cache and rate-limit-aware backoff,
+plus size-aware choice among the renditions Pexels serves for each photo.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from http_client import TIMEOUT_SECONDS, get_session
+from stage_runner import RateLimiter, capped_timeout, request_timeout
+
+SEARCH_URL = "https://api.pexels.com/v1/search"
+CACHE_PATH = Path(
+    os.environ.get(
+        "PEXELS_CACHE_PATH",
+        Path(__file__).resolve().parent.parent / ".cache" / "pexels" / "search.json",
+    )
+)
+CACHE_TTL_SECONDS = int(os.environ.get("PEXELS_CACHE_TTL_HOURS", "168")) * 3600
+# X-Ratelimit-* describe the monthly quota, which waiting cannot refill: once
+# fewer than this many calls remain, stale cached results are served instead.
+LOW_REMAINING = int(os.environ.get("PEXELS_LOW_REMAINING", "20"))
+MAX_RETRIES = 3
+MAX_BACKOFF_SECONDS = 60.0
+# Shared by all batch workers so concurrent days stay inside the hourly quota.
+RATE_LIMITER = RateLimiter(float(os.environ.get("PEXELS_RPM", "30")))
+# `src` renditions as (box width, box height, cropped). Boxed renditions are
+# scaled to fit the box (None leaves that side free); cropped ones are cut to it.
+RENDITIONS: Dict[str, Tuple[int | None, int, bool]] = {
+    "large2x": (1880, 1300, False),
+    "large": (940, 650, False),
+    "medium": (None, 350, False),
+    "small": (None, 130, False),
+    "landscape": (1200, 627, True),
+    "portrait": (800, 1200, True),
+    "tiny": (280, 200, True),
+}
+# Largest share of the frame a cropped rendition may cut away
+MAX_CROP = float(os.environ.get("PEXELS_MAX_CROP", "0.1"))
+# Ask the image CDN for exactly the target size instead of the nearest listed rendition
+CUSTOM_RENDITIONS = os.environ.get("PEXELS_CUSTOM_RENDITIONS", "1") != "0"
+
+_lock = threading.Lock()
+_remaining: int | None = None
+_reset_at: float | None = None
+_cache: Dict[str, Dict[str, Any]] | None = None
+
+
+class RateLimitExhausted(RuntimeError):
+    pass
+
+
+def cache_key(query: str, per_page: int, orientation: str) -> str:
+    normalized = " ".join(query.lower().split())
+    return f"{normalized}|{per_page}|{orientation}"
+
+
+def _load_cache() -> Dict[str, Dict[str, Any]]:
+    global _cache
+    if _cache is None:
+        try:
+            _cache = json.loads(CACHE_PATH.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache() -> None:
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = CACHE_PATH.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(_load_cache()), encoding="utf-8")
+    os.replace(tmp_path, CACHE_PATH)
+
+
+def _record_rate_limit(headers: Any) -> None:
+    global _remaining, _reset_at
+    remaining = headers.get("X-Ratelimit-Remaining")
+    if remaining is not None and str(remaining).isdigit():
+        _remaining = int(remaining)
+    reset = headers.get("X-Ratelimit-Reset")
+    if reset is not None and str(reset).isdigit():
+        _reset_at = float(reset)
+
+
+def _quota_low() -> bool:
+    return _remaining is not None and _remaining < LOW_REMAINING and time.time() < (_reset_at or float("inf"))
+
+
+def _check_quota() -> None:
+    """Raise instead of calling once the quota is spent; it only refills at the reset."""
+    if _quota_low() and _remaining is not None and _remaining <= 0:
+        raise RateLimitExhausted("Pexels quota exhausted until it resets.")
+
+
+def _retry_after(headers: Any, attempt: int) -> float:
+    value = headers.get("Retry-After")
+    if value and str(value).isdigit():
+        return min(MAX_BACKOFF_SECONDS, float(value))
+    return min(MAX_BACKOFF_SECONDS, 2.0 ** (attempt + 1))
+
+
+def _request(api_key: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    for attempt in range(MAX_RETRIES):
+        with _lock:
+            _check_quota()
+        RATE_LIMITER.acquire()
+        resp = get_session().get(
+            SEARCH_URL,
+            headers={"Authorization": api_key},
+            params=params,
+            timeout=capped_timeout(TIMEOUT_SECONDS),
+        )
+        with _lock:
+            _record_rate_limit(resp.headers)
+        if resp.status_code == 429 and attempt < MAX_RETRIES - 1:
+            wait = _retry_after(resp.headers, attempt)
+            remaining = request_timeout()
+            if remaining is not None and wait >= remaining:
+                raise TimeoutError("Pexels asked to wait past the pipeline deadline.")
+            print(f"Pexels returned 429; retrying in {wait:.0f}s.")
+            time.sleep(wait)
+            continue
+        resp.raise_for_status()
+        return resp.json().get("photos") or []
+    raise RateLimitExhausted("Pexels kept returning 429.")
+
+
+def search_photos(
+    api_key: str, query: str, per_page: int = 6, orientation: str = "landscape"
+) -> List[Dict[str, Any]]:
+    """Return raw Pexels photo objects, served from the cache while fresh.
+
+    A stale cache entry is still returned if the live request fails, and
+    instead of a live request while the quota is low.
+    """
+    key = cache_key(query, per_page, orientation)
+    with _lock:
+        entry = _load_cache().get(key)
+        quota_low = _quota_low()
+    if entry and time.time() - entry["fetched"] < CACHE_TTL_SECONDS:
+        return entry["photos"]
+    if entry and quota_low:
+        print(f"Pexels quota low ({_remaining} left); using cached results for '{query}'.")
+        return entry["photos"]
+
+    params = {"query": query, "per_page": per_page, "orientation": orientation}
+    try:
+        photos = _request(api_key, params)
+    except Exception:
+        if entry:
+            print(f"Pexels search failed; using cached results for '{query}'.")
+            return entry["photos"]
+        raise
+
+    with _lock:
+        _load_cache()[key] = {"fetched": time.time(), "photos": photos}
+        _save_cache()
+    return photos
+
+
+def fit_within(width: int, height: int, box_width: int | None, box_height: int) -> Tuple[int, int]:
+    """Size of width x height scaled down (never up) to fit the box."""
+    scale = min(1.0, box_height / height, box_width / width if box_width else 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def rendition_geometry(name: str, width: int, height: int) -> Tuple[int, int, float] | None:
+    """(width, height, share of the frame cropped away) of a rendition, or None if unknown."""
+    if name == "original":
+        return width, height, 0.0
+    if name not in RENDITIONS:
+        return None
+    box_width, box_height, cropped = RENDITIONS[name]
+    if not cropped:
+        return (*fit_within(width, height, box_width, box_height), 0.0)
+    aspect = box_width / box_height
+    kept = min(width / height, aspect) / max(width / height, aspect)
+    return box_width, box_height, 1 - kept
+
+
+def custom_rendition(src: Dict[str, str], width: int, height: int, target: Tuple[int, int]) -> str | None:
+    """URL of the original resized by the CDN to exactly fit target."""
+    original = src.get("original")
+    if not CUSTOM_RENDITIONS or not original or not original.startswith("https://images.pexels.com/"):
+        return None
+    fitted_width, fitted_height = fit_within(width, height, *target)
+    if (fitted_width, fitted_height) == (width, height):
+        return None
+    return f"{original.split('?', 1)[0]}?auto=compress&cs=tinysrgb&w={fitted_width}&h={fitted_height}"
+
+
+def pick_rendition(photo: Dict[str, Any], target: Tuple[int, int]) -> Tuple[str, str] | None:
+    """Return (rendition name, url) of the smallest rendition that still covers target.
+
+    A rendition covers target when scaling it into the target box loses no
+    resolution against scaling the original's same framing. Cropped
+    renditions only qualify when they cut away at most MAX_CROP of the frame,
+    and their pixel count is weighed up by what they cut. When nothing
+    covers target, the sharpest rendition wins.
+    """
+    src = photo.get("src") or {}
+    width, height = int(photo.get("width") or 0), int(photo.get("height") or 0)
+    if not width or not height:
+        # No geometry to reason about; keep the historical preference order
+        for name in ("large2x", "large", "original", "medium", "small"):
+            if src.get(name):
+                return name, src[name]
+        return None
+    custom = custom_rendition(src, width, height, target)
+    if custom:
+        return "custom", custom
+
+    covering: List[Tuple[float, str]] = []
+    sharpest: List[Tuple[float, int, str]] = []
+    for name, url in src.items():
+        geometry = rendition_geometry(name, width, height) if url else None
+        if geometry is None or geometry[2] > MAX_CROP:
+            continue
+        rendition_width, rendition_height, crop = geometry
+        # The original trimmed to this rendition's framing, fitted to target
+        aspect = rendition_width / rendition_height
+        frame = (min(width, height * aspect), min(height, width / aspect))
+        needed_width, _ = fit_within(round(frame[0]), round(frame[1]), *target)
+        pixels = rendition_width * rendition_height
+        if rendition_width >= needed_width:
+            covering.append((pixels / (1 - crop), name))
+        sharpest.append((min(1.0, rendition_width / needed_width) * (1 - crop), -pixels, name))
+    if covering:
+        name = min(covering)[1]
+    elif sharpest:
+        name = max(sharpest)[2]
+    else:
+        return None
+    return name, src[name]
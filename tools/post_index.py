@@ -0,0 +1,154 @@
+"""
+Persistent index of _posts front matter so tools can look up post metadata
+without re-reading and re-parsing every markdown file.
+
+The index is refreshed incrementally: only files whose mtime or size changed
+since the last run are parsed again.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List
+
+from front_matter import read_front_matter_many
+
+POSTS_DIR = Path(__file__).resolve().parent.parent / "_posts"
+INDEX_PATH = Path(
+    os.environ.get(
+        "POST_INDEX_PATH",
+        Path(__file__).resolve().parent.parent / ".cache" / "posts_index.json",
+    )
+)
+# Bump when the stored record shape changes so old indexes are rebuilt.
+INDEX_VERSION = 1
+
+
+def image_path_of(front_matter: Dict[str, Any]) -> str | None:
+    """Return the post's image path, or None when it has no usable image."""
+    value = front_matter.get("image")
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return value.get("path") or None
+    return None
+
+
+def _as_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
+def build_record(path: Path, stat: os.stat_result, front_matter: Dict[str, Any]) -> Dict[str, Any]:
+    image = front_matter.get("image")
+    return {
+        "file": path.name,
+        "title": str(front_matter.get("title") or ""),
+        "permalink": str(front_matter.get("permalink") or ""),
+        "tags": _as_list(front_matter.get("tags")),
+        "categories": _as_list(front_matter.get("categories")),
+        "image": image_path_of(front_matter),
+        "lqip": bool(isinstance(image, dict) and image.get("lqip")),
+        "date": str(front_matter.get("date") or ""),
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+
+class PostIndex:
+    def __init__(self, posts_dir: Path = POSTS_DIR, path: Path = INDEX_PATH) -> None:
+        self.posts_dir = posts_dir
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Any]] = self._load()
+        self._by_permalink: Dict[str, str] = {}
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._by_permalink = {
+            record["permalink"]: name for name, record in sorted(self._records.items()) if record["permalink"]
+        }
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION or data.get("posts_dir") != str(self.posts_dir):
+            return {}
+        return data.get("posts", {})
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": INDEX_VERSION, "posts_dir": str(self.posts_dir), "posts": self._records}
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(payload, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def refresh(self) -> "PostIndex":
+        """Re-parse new or changed posts, drop deleted ones, and persist if anything changed.
+
+        Changed posts are parsed together in one batch.
+        """
+        with self._lock:
+            seen = set()
+            stale: Dict[Path, os.stat_result] = {}
+            with os.scandir(self.posts_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".md") or not entry.is_file():
+                        continue
+                    seen.add(entry.name)
+                    stat = entry.stat()
+                    record = self._records.get(entry.name)
+                    if record and record["mtime"] == stat.st_mtime_ns and record["size"] == stat.st_size:
+                        continue
+                    stale[Path(entry.path)] = stat
+            changed = bool(stale)
+            parsed, errors = read_front_matter_many(stale)
+            for path, (front_matter, _) in parsed.items():
+                self._records[path.name] = build_record(path, stale[path], front_matter)
+            for path, exc in errors.items():
+                print(f"Could not index {path.name}: {exc}")
+                self._records.pop(path.name, None)
+            for name in set(self._records) - seen:
+                del self._records[name]
+                changed = True
+            if changed:
+                self._reindex()
+                self._save()
+        return self
+
+    def all(self) -> List[Dict[str, Any]]:
+        return [self._records[name] for name in sorted(self._records)]
+
+    def get(self, filename: str) -> Dict[str, Any] | None:
+        return self._records.get(filename)
+
+    def path_of(self, record: Dict[str, Any]) -> Path:
+        return self.posts_dir / record["file"]
+
+    def by_date(self, day: str) -> List[Dict[str, Any]]:
+        """Posts whose filename starts with the ISO date (YYYY-MM-DD)."""
+        return [record for record in self.all() if record["file"].startswith(f"{day}-")]
+
+    def by_permalink(self, permalink: str) -> Dict[str, Any] | None:
+        name = self._by_permalink.get(permalink)
+        return self._records[name] if name else None
+
+    def by_tag(self, tag: str) -> List[Dict[str, Any]]:
+        tag = tag.lower()
+        return [record for record in self.all() if tag in (t.lower() for t in record["tags"])]
+
+    def by_image(self, image: str) -> List[Dict[str, Any]]:
+        name = Path(image).name
+        return [
+            record for record in self.all() if record["image"] and Path(record["image"]).name == name
+        ]
+
+    def without_image(self) -> List[Dict[str, Any]]:
+        return [record for record in self.all() if record["image"] is None]
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Reconcile _posts with assets/img: list images no post uses, references to
+files that do not exist, and images shared by several posts.
+
+References come from front-matter `image` fields (including `sources`),
+inline markdown/HTML images in post bodies, and any `assets/img/...` path
+mentioned in the site config, tabs, includes or data files. srcset variants
+and AVIF alternates count as used whenever their base image is.
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+from front_matter import read_body, read_front_matter_many
+from image_metadata import resolve_image
+from image_variants import MANIFEST_PATH, VARIANT_NAME, forget_variants, web_path_of
+from post_index import POSTS_DIR
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+ASSETS_DIR = ROOT_DIR / "assets" / "img"
+ASSET_SUFFIXES = {".webp", ".avif", ".png", ".jpg", ".jpeg", ".gif", ".svg"}
+# Site chrome referenced by directory, not by file
+SKIPPED_DIRS = {"favicons"}
+SITE_SOURCES = ["_config.yml", "index.html", "_tabs", "_includes", "_layouts", "_data"]
+MARKDOWN_IMAGE = re.compile(r"!\[[^\]]*\]\(\s*<?([^)\s>]+)")
+HTML_IMAGE = re.compile(r"<img\b[^>]*?\ssrc=[\"']([^\"']+)[\"']", re.IGNORECASE)
+SITE_PATH = re.compile(r"assets/img/[^\s\"'()<>{}|]+")
+
+
+def asset_files() -> List[Path]:
+    return sorted(
+        path
+        for path in ASSETS_DIR.rglob("*")
+        if path.is_file()
+        and path.suffix.lower() in ASSET_SUFFIXES
+        and not SKIPPED_DIRS.intersection(path.relative_to(ASSETS_DIR).parts)
+    )
+
+
+def base_of(path: Path) -> Path:
+    """The image a derived file belongs to: `x-480w.webp` and `x.avif` map to `x.webp`."""
+    stem = VARIANT_NAME.sub("", path.stem)
+    if stem != path.stem or path.suffix.lower() == ".avif":
+        return path.with_name(f"{stem}.webp")
+    return path
+
+
+def resolve_reference(value: str, front_matter: Dict[str, Any]) -> Path | None:
+    """Resolve an image reference the way Chirpy does, or None for remote URLs."""
+    value = value.split("#", 1)[0].split("?", 1)[0].strip()
+    if not value or "://" in value or value.startswith(("data:", "{{")):
+        return None
+    return resolve_image({"image": value, "media_subpath": front_matter.get("media_subpath")})
+
+
+def post_references(path: Path, front_matter: Dict[str, Any], body_offset: int) -> List[Tuple[str, Path]]:
+    """Return (where, file) pairs for every local image a post references."""
+    references = []
+    image = front_matter.get("image")
+    main = resolve_image(front_matter)
+    if main is not None:
+        references.append(("image", main))
+    if isinstance(image, dict):
+        for source in image.get("sources") or []:
+            target = resolve_reference(str(source.get("path") or ""), front_matter)
+            if target is not None:
+                references.append(("image.sources", target))
+    body = read_body(path, body_offset)
+    for match in list(MARKDOWN_IMAGE.finditer(body)) + list(HTML_IMAGE.finditer(body)):
+        target = resolve_reference(match.group(1), front_matter)
+        if target is not None:
+            references.append(("body", target))
+    return references
+
+
+def site_references() -> Set[Path]:
+    """Files named by path in site config, tabs, includes, layouts and data."""
+    referenced = set()
+    for name in SITE_SOURCES:
+        root = ROOT_DIR / name
+        files = sorted(root.rglob("*")) if root.is_dir() else [root]
+        for path in files:
+            if not path.is_file() or path == MANIFEST_PATH:
+                continue
+            text = path.read_text(encoding="utf-8", errors="ignore")
+            referenced.update((ROOT_DIR / match.rstrip(".,;:")).resolve() for match in SITE_PATH.findall(text))
+    return referenced
+
+
+def reconcile() -> Tuple[List[Path], List[Tuple[str, str, Path]], Dict[Path, List[str]]]:
+    """Return (orphaned files, broken references, files used by several posts)."""
+    # Jekyll skips dot-files such as the post template
+    posts = sorted(path for path in POSTS_DIR.glob("*.md") if not path.name.startswith("."))
+    parsed, errors = read_front_matter_many(posts)
+    for path, exc in errors.items():
+        print(f"Skipping {path.name}: {exc}")
+
+    used_by: Dict[Path, List[str]] = {}
+    broken: List[Tuple[str, str, Path]] = []
+    for path, (front_matter, offset) in sorted(parsed.items()):
+        for where, target in post_references(path, front_matter, offset):
+            target = target.resolve()
+            if not target.is_file():
+                broken.append((path.name, where, target))
+                continue
+            if where == "image":
+                used_by.setdefault(target, []).append(path.name)
+            else:
+                used_by.setdefault(target, [])
+
+    referenced = set(used_by) | site_references()
+    orphans = [
+        path for path in asset_files() if path.resolve() not in referenced and base_of(path).resolve() not in referenced
+    ]
+    shared = {path: posts for path, posts in used_by.items() if len(posts) > 1}
+    return orphans, broken, shared
+
+
+def relative(path: Path) -> str:
+    try:
+        return path.relative_to(ROOT_DIR).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find orphaned images and broken image references.")
+    parser.add_argument("--prune", action="store_true", help="Delete orphaned images and their srcset manifest entries")
+    args = parser.parse_args()
+
+    orphans, broken, shared = reconcile()
+
+    orphan_bytes = sum(path.stat().st_size for path in orphans)
+    print(f"Orphaned images ({len(orphans)}, {orphan_bytes / 1024:.0f}KB):")
+    for path in orphans:
+        print(f"  {relative(path)}")
+    print(f"Broken references ({len(broken)}):")
+    for post, where, target in broken:
+        print(f"  {post} [{where}] -> {relative(target)}")
+    print(f"Images shared by several posts ({len(shared)}):")
+    for path, posts in sorted(shared.items()):
+        print(f"  {relative(path)} <- {', '.join(posts)}")
+
+    if args.prune and orphans:
+        for path in orphans:
+            path.unlink()
+            if base_of(path) == path:
+                forget_variants(web_path_of(path))
+        print(f"Deleted {len(orphans)} orphaned image(s), {orphan_bytes / 1024:.0f}KB.")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:  # pragma: no cover
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(1)
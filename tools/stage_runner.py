@@ -0,0 +1,161 @@
+"""
+Pipeline helpers: named stages run sequentially or concurrently under a shared
+deadline with per-stage wall time, plus per-provider rate limiting.
+
+Parallel stages run on daemon threads, so a stage stuck in a network call
+cannot keep the process alive once the deadline has passed; network calls
+made inside a stage should also pass request_timeout() (or capped_timeout())
+to their client, and work handed to other threads should be wrapped with
+in_current_stage() so those threads see the same deadline.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, Future, wait
+from typing import Any, Callable, Dict
+
+_local = threading.local()
+
+
+class StageCancelled(RuntimeError):
+    pass
+
+
+class StageRunner:
+    def __init__(self, deadline_seconds: float) -> None:
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_seconds
+        self.timings: Dict[str, float] = {}
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def check(self) -> None:
+        """Raise if the run was cancelled or is past its deadline.
+
+        Stages call this between steps; threads cannot be interrupted, so
+        cancellation takes effect at the next check.
+        """
+        if self.cancelled.is_set():
+            raise StageCancelled("Stage cancelled after a sibling stage failed.")
+        if self.remaining() <= 0:
+            raise TimeoutError("Pipeline deadline exceeded.")
+
+    def run(self, name: str, func: Callable[..., Any], *args: Any) -> Any:
+        self.check()
+        start = time.monotonic()
+        outer = getattr(_local, "runner", None)
+        _local.runner = self
+        try:
+            return func(*args)
+        finally:
+            _local.runner = outer
+            with self._lock:
+                self.timings[name] = time.monotonic() - start
+
+    def _run_into(self, future: Future, name: str, func: Callable[[], Any]) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self.run(name, func))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    def run_all(self, stages: Dict[str, Callable[[], Any]], parallel: bool) -> Dict[str, Any]:
+        """Run independent stages and return their results by name.
+
+        In parallel mode the first failure (or the deadline) cancels the rest.
+        """
+        if not parallel:
+            return {name: self.run(name, func) for name, func in stages.items()}
+
+        futures: Dict[Future, str] = {}
+        for name, func in stages.items():
+            future: Future = Future()
+            futures[future] = name
+            threading.Thread(
+                target=self._run_into, args=(future, name, func), name=f"stage-{name}", daemon=True
+            ).start()
+        try:
+            done, pending = wait(futures, timeout=max(0.0, self.remaining()), return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    raise future.exception()  # type: ignore[misc]
+            if pending:
+                names = ", ".join(sorted(futures[future] for future in pending))
+                raise TimeoutError(f"Pipeline deadline exceeded waiting for: {names}")
+            return {futures[future]: future.result() for future in done}
+        except BaseException:
+            self.cancelled.set()
+            raise
+
+    def report(self, label: str = "") -> None:
+        print(f"Stage timings{f' ({label})' if label else ''}:")
+        for name, seconds in self.timings.items():
+            print(f"  {name}: {seconds:.2f}s")
+        print(f"  total: {time.monotonic() - self.started:.2f}s")
+
+
+def request_timeout() -> float | None:
+    """Seconds left for a network call made inside a stage, or None outside one.
+
+    Raises like StageRunner.check() when the stage's run is already over.
+    """
+    runner = getattr(_local, "runner", None)
+    if runner is None:
+        return None
+    runner.check()
+    return runner.remaining()
+
+
+def capped_timeout(default: float) -> float:
+    """default, shortened to the seconds the current stage has left."""
+    remaining = request_timeout()
+    return default if remaining is None else min(default, remaining)
+
+
+def in_current_stage(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap func so it runs under the calling thread's stage on any thread."""
+    runner = getattr(_local, "runner", None)
+
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        outer = getattr(_local, "runner", None)
+        _local.runner = runner
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.runner = outer
+
+    return wrapper
+
+
+class RateLimiter:
+    """Token bucket shared by every worker that calls one provider.
+
+    Up to per_minute calls may burst; after that callers block until a token
+    refills, so a single run is never slowed down but a batch is paced.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = max(1.0, per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)